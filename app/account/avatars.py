@@ -0,0 +1,57 @@
+import io
+import os
+
+from PIL import Image as PILImage, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+
+def open_photo(f):
+    source = PILImage.open(f)
+    # apply the EXIF orientation before the metadata is dropped
+    source = ImageOps.exif_transpose(source)
+    return source.convert('RGB')
+
+
+def encode_jpeg(image, name):
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85, progressive=True, optimize=True)
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+def avatar_name(photo_name, size):
+    # next to the photo, so they move with it
+    return f'{os.path.splitext(photo_name)[0]}_avatar{size}.jpg'
+
+
+def downscale_photo(f):
+    """
+    Re-encode an uploaded profile photo as a JPEG that fits in
+    AVATAR_MAX_SIZE, without its metadata.
+    """
+    source = open_photo(f)
+    size = settings.AVATAR_MAX_SIZE
+    source.thumbnail((size, size), PILImage.LANCZOS, reducing_gap=3.0)
+    name = os.path.splitext(os.path.basename(f.name))[0] + '.jpg'
+    return encode_jpeg(source, name)
+
+
+def generate_avatars(profile):
+    """
+    Store square avatars of the profile photo for every AVATAR_SIZES and
+    save their URLs on the profile. Returns the avatars mapping.
+    """
+    storage = profile.photo.storage
+    with profile.photo.open('rb') as f:
+        source = open_photo(f)
+    avatars = {}
+    for size in settings.AVATAR_SIZES:
+        avatar = ImageOps.fit(source, (size, size), PILImage.LANCZOS, centering=(0.5, 0.4))
+        name = avatar_name(profile.photo.name, size)
+        if storage.exists(name):
+            storage.delete(name)
+        name = storage.save(name, encode_jpeg(avatar, os.path.basename(name)))
+        avatars[str(size)] = storage.url(name)
+    profile.avatars = avatars
+    type(profile).objects.filter(id=profile.id).update(avatars=avatars)
+    return avatars
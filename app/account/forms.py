@@ -1,5 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
+from django.core.files.uploadedfile import UploadedFile
+from .avatars import downscale_photo
 from .models import Profile
 
 
@@ -20,6 +22,25 @@ class ProfileEditForm(forms.ModelForm):
         model = Profile
         fields = ['date_of_birth', 'photo']
 
+    def clean_photo(self):
+        photo = self.cleaned_data['photo']
+        if isinstance(photo, UploadedFile):
+            # new upload, store it downscaled instead of as sent
+            try:
+                photo = downscale_photo(photo)
+            except OSError:
+                raise forms.ValidationError('Could not read the image.')
+        return photo
+
+    def save(self, commit=True):
+        profile = super().save(commit=False)
+        if 'photo' in self.changed_data:
+            # the avatars of the previous photo
+            profile.avatars = {}
+        if commit:
+            profile.save()
+        return profile
+
 class LoginForm(forms.Form):
     """
     Login form - presented to the user to enter their details. Will be used to authenticate the users against the database.
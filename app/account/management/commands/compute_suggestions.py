@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from account.suggestions import compute_suggestions
+
+
+class Command(BaseCommand):
+    help = 'Recompute the who-to-follow suggestions of every active user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        def progress(done, total):
+            self.stdout.write(f'{done}/{total} users')
+
+        done = compute_suggestions(options['batch_size'], progress)
+        self.stdout.write(self.style.SUCCESS(f'Stored suggestions for {done} users.'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from account.avatars import generate_avatars
+from account.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Generate the avatars of profiles that have a photo but no avatars yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate the avatars of every profile.')
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.exclude(photo='').order_by('id')
+        if not options['all']:
+            profiles = profiles.filter(avatars={})
+        done = failed = 0
+        for profile in profiles.iterator(chunk_size=500):
+            try:
+                generate_avatars(profile)
+                done += 1
+            except OSError as e:
+                failed += 1
+                self.stderr.write(f'Profile {profile.id}: {e}')
+            if done and done % 500 == 0:
+                self.stdout.write(f'{done} profiles processed')
+        self.stdout.write(self.style.SUCCESS(f'Generated avatars for {done} profiles, {failed} failed.'))
@@ -0,0 +1,20 @@
+# Generated by Django 4.1.13 on 2026-10-18 23:09
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("account", "0003_rename_user_form_contact_user_from"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="profile",
+            name="photo",
+            field=models.ImageField(
+                blank=True, upload_to=core.storage.ShardedUploadTo("users")
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-18 23:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("account", "0004_alter_profile_photo"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="avatars",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
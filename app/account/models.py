@@ -1,12 +1,15 @@
 from django.db import models
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from core.storage import ShardedUploadTo
 
 # Create your models here.
 class Profile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     date_of_birth = models.DateField(blank=True, null=True)
-    photo = models.ImageField(upload_to='users/%Y/%m/%d', blank=True)
+    photo = models.ImageField(upload_to=ShardedUploadTo('users'), blank=True)
+    # avatar URLs by size, generated from the photo by a worker
+    avatars = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f'Profile of {self.user.username}'
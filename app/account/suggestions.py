@@ -0,0 +1,96 @@
+import heapq
+from collections import Counter, defaultdict
+
+from django.contrib.auth.models import User
+
+from core import redis_client
+from images.models import Image
+from .models import Contact
+
+# suggestions stored per user and shown on the dashboard
+KEEP = 20
+SHOWN = 5
+# a path through a followed user counts more than a shared like
+FRIEND_OF_FRIEND_WEIGHT = 2
+CO_LIKER_WEIGHT = 1
+# degree caps keep the job linear in the number of edges: only the most
+# recent follows and likes of a user count, and images liked by very many
+# people say little about shared taste
+MAX_FOLLOWING = 200
+MAX_LIKES = 200
+MAX_IMAGE_LIKERS = 100
+
+def suggestions_key(user_id):
+    return f'user:{user_id}:suggestions'
+
+
+def capped_adjacency(pairs, cap):
+    adjacency = defaultdict(list)
+    for a, b in pairs:
+        if len(adjacency[a]) < cap:
+            adjacency[a].append(b)
+    return adjacency
+
+
+def compute_suggestions(batch_size=500, progress=None):
+    """
+    Rank who to follow for every active user: people followed by the users
+    they follow, and people who like the same images. Stores the top KEEP
+    candidates of each user in Redis.
+    """
+    following = capped_adjacency(
+        Contact.objects.order_by('-created').values_list('user_from_id', 'user_to_id')
+        .iterator(chunk_size=10000), MAX_FOLLOWING)
+    likes = capped_adjacency(
+        Image.users_like.through.objects.order_by('-id').values_list('user_id', 'image_id')
+        .iterator(chunk_size=10000), MAX_LIKES)
+    likers = defaultdict(list)
+    for user_id, image_ids in likes.items():
+        for image_id in image_ids:
+            likers[image_id].append(user_id)
+    for image_id in [i for i, users in likers.items() if len(users) > MAX_IMAGE_LIKERS]:
+        del likers[image_id]
+
+    user_ids = list(User.objects.filter(is_active=True).values_list('id', flat=True))
+    active = set(user_ids)
+    r = redis_client.get_job_redis()
+    # a transaction per batch, so readers never see a key between delete and zadd
+    pipe = r.pipeline()
+    done = 0
+    for user_id in user_ids:
+        scores = Counter()
+        for friend in following.get(user_id, ()):
+            for candidate in following.get(friend, ()):
+                scores[candidate] += FRIEND_OF_FRIEND_WEIGHT
+        for image_id in likes.get(user_id, ()):
+            for candidate in likers.get(image_id, ()):
+                scores[candidate] += CO_LIKER_WEIGHT
+        exclude = set(following.get(user_id, ()))
+        exclude.add(user_id)
+        candidates = ((candidate, score) for candidate, score in scores.items()
+                      if candidate not in exclude and candidate in active)
+        top = heapq.nlargest(KEEP, candidates, key=lambda item: item[1])
+        key = suggestions_key(user_id)
+        pipe.delete(key)
+        if top:
+            pipe.zadd(key, dict(top))
+        done += 1
+        if done % batch_size == 0:
+            pipe.execute()
+            if progress:
+                progress(done, len(user_ids))
+    pipe.execute()
+    return done
+
+
+def get_suggestions(user, count=SHOWN):
+    # no suggestions while Redis is unavailable
+    ids = redis_client.call(lambda r: r.zrevrange(suggestions_key(user.id), 0, count - 1), default=[])
+    ids = [int(id) for id in ids]
+    users = User.objects.filter(id__in=ids, is_active=True).select_related('profile')
+    return sorted(users, key=lambda u: ids.index(u.id))
+
+
+def remove_suggestion(user, followed):
+    # following someone takes them off the user's suggestions right away
+    redis_client.call(lambda r: r.zrem(suggestions_key(user.id), followed.id))
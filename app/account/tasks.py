@@ -0,0 +1,16 @@
+from celery import shared_task
+from .avatars import generate_avatars
+from .models import Profile
+from .suggestions import compute_suggestions
+
+
+@shared_task
+def compute_suggestions_task():
+    return compute_suggestions()
+
+
+@shared_task
+def generate_avatars_task(profile_id):
+    profile = Profile.objects.filter(id=profile_id).first()
+    if profile and profile.photo:
+        return generate_avatars(profile)
@@ -0,0 +1,17 @@
+from django import template
+
+from account.models import Profile
+
+register = template.Library()
+
+
+@register.filter
+def avatar(profile, size):
+    """
+    URL of the avatar of the given size, or of the photo until the avatars
+    are generated. Empty for users without a profile or photo, such as
+    social or createsuperuser accounts. Never touches the storage.
+    """
+    if not isinstance(profile, Profile) or not profile.photo:
+        return ''
+    return (profile.avatars or {}).get(str(size)) or profile.photo.url
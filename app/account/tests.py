@@ -1,3 +1,30 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from core.tests import RedisServerMixin
+from .models import Profile
+from .templatetags.avatar_tags import avatar
+
+
+class AvatarTests(RedisServerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('ann', password='secret')
+
+    def test_filter(self):
+        profile = Profile(user=self.user, photo='users/ab/cd/ann.jpg')
+        self.assertEqual(avatar(profile, 80), '/media/users/ab/cd/ann.jpg')
+        profile.avatars = {'80': '/media/users/ab/cd/ann_avatar80.jpg'}
+        self.assertEqual(avatar(profile, 80), '/media/users/ab/cd/ann_avatar80.jpg')
+        self.assertEqual(avatar(profile, 180), '/media/users/ab/cd/ann.jpg')
+        self.assertEqual(avatar(Profile(user=self.user), 80), '')
+        # a missing profile resolves to '' in templates
+        self.assertEqual(avatar('', 80), '')
+
+    def test_pages_of_users_without_a_profile(self):
+        # e.g. social or createsuperuser accounts
+        User.objects.create_user('bob')
+        self.client.login(username='ann', password='secret')
+        self.assertEqual(self.client.get('/account/users/').status_code, 200)
+        self.assertEqual(self.client.get('/account/users/bob/').status_code, 200)
+        self.assertEqual(self.client.get('/account/').status_code, 200)
@@ -12,7 +12,11 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from .models import Contact
 from actions.utils import create_action
-from actions.models import Action
+from actions.retention import hot_actions
+from django.core.paginator import Paginator
+from .suggestions import get_suggestions, remove_suggestion
+from .tasks import generate_avatars_task
+from core.ratelimit import rate_limit
 
 # Create your views here.
 @login_required
@@ -26,7 +30,10 @@ def edit(request):
         )
         if user_form.is_valid() and profile_form.is_valid():
             user_form.save()
-            profile_form.save()
+            profile = profile_form.save()
+            if 'photo' in profile_form.changed_data and profile.photo:
+                # templates show the photo until the worker made the avatars
+                generate_avatars_task.delay(profile.id)
             messages.success(request, 'Profile updated successfully!')
         else:
             messages.error(request, 'Error updating your profile')
@@ -83,18 +90,21 @@ def user_login(request):
 @login_required
 def dashboard(request):
     # Display all actions by default
-    actions = Action.objects.exclude(user=request.user)
+    actions = hot_actions().exclude(user=request.user)
     following_ids = request.user.following.values_list('id', flat=True)
     if following_ids:
         # if user is following others, retrive only their actions
         actions = actions.filter(user_id__in=following_ids)
     actions = actions.select_related('user', 'user__profile').prefetch_related('target')[:10]
-    return render(request, 'account/dashboard.html', {'section': 'dashboard', 'actions':actions})
+    return render(request, 'account/dashboard.html', {'section': 'dashboard', 'actions':actions,
+                                                      'suggestions': get_suggestions(request.user)})
 
 
 @login_required
 def user_list(request):
-    users = User.objects.filter(is_active=True)
+    users = User.objects.filter(is_active=True).select_related('profile').order_by('username')
+    paginator = Paginator(users, 24)
+    users = paginator.get_page(request.GET.get('page'))
     return render(request, 'account/user/list.html', {
         'section': 'people',
         'users': users
@@ -112,6 +122,7 @@ def user_detail(request, username):
 
 @require_POST
 @login_required
+@rate_limit('user_follow')
 def user_follow(request):
     user_id = request.POST.get('id')
     action = request.POST.get('action')
@@ -121,6 +132,7 @@ def user_follow(request):
             if action == 'follow':
                 Contact.objects.get_or_create( user_from=request.user, user_to=user)
                 create_action(request.user, 'is following', user)
+                remove_suggestion(request.user, user)
             else:
                 Contact.objects.filter(user_from=request.user, user_to=user).delete()
             return JsonResponse({'status':'ok'})
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Action
+from .models import Action, ActionRollup
 
 # Register your models here.
 @admin.register(Action)
@@ -7,3 +7,10 @@ class ActionAdmin(admin.ModelAdmin):
     list_display = ['user', 'verb', 'target', 'created']
     list_filter = ['created']
     search_fields = ['verb']
+
+
+@admin.register(ActionRollup)
+class ActionRollupAdmin(admin.ModelAdmin):
+    list_display = ['user', 'verb', 'day', 'count']
+    list_filter = ['day']
+    search_fields = ['verb']
@@ -0,0 +1,34 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from actions.retention import open_archive, rollup_actions
+
+
+class Command(BaseCommand):
+    help = ('Roll actions older than the retention horizon into per-user daily counts '
+            'and delete them in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ACTION_HOT_DAYS,
+                            help='Keep the actions of the last DAYS days.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to wait between batches.')
+        parser.add_argument('--archive-dir', default=settings.ACTION_ARCHIVE_DIR,
+                            help='Write the deleted actions to a gzipped JSON lines file here.')
+
+    def handle(self, *args, **options):
+        horizon = timezone.now() - datetime.timedelta(days=options['days'])
+        archive = open_archive(options['archive_dir']) if options['archive_dir'] else None
+
+        def progress(done):
+            self.stdout.write(f'{done} actions rolled up')
+
+        try:
+            done = rollup_actions(horizon, options['batch_size'], archive, options['pause'], progress)
+        finally:
+            if archive:
+                archive.close()
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {done} actions older than {horizon:%Y-%m-%d}.'))
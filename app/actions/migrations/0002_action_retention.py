@@ -0,0 +1,56 @@
+# Generated by Django 4.1.13 on 2026-10-18 23:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("actions", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ActionRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("verb", models.CharField(max_length=255)),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["-day"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="action",
+            index=models.Index(
+                fields=["user", "-created"], name="actions_act_user_id_5d614b_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="actionrollup",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="action_rollups",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="actionrollup",
+            constraint=models.UniqueConstraint(
+                fields=("user", "day", "verb"), name="unique_action_rollup"
+            ),
+        ),
+    ]
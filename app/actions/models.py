@@ -14,6 +14,27 @@ class Action(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['-created']),
+            models.Index(fields=['user', '-created']),
             models.Index(fields=['target_ct', 'target_id']),
         ]
-        ordering = ['-created']
\ No newline at end of file
+        ordering = ['-created']
+
+
+class ActionRollup(models.Model):
+    """
+    Number of actions of a verb made by a user on a day, kept once the
+    actions themselves are past the retention horizon.
+    """
+    user = models.ForeignKey('auth.User', related_name='action_rollups', on_delete=models.CASCADE)
+    day = models.DateField()
+    verb = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'verb'], name='unique_action_rollup'),
+        ]
+        ordering = ['-day']
+
+    def __str__(self):
+        return f'{self.user} {self.verb} x{self.count} on {self.day}'
\ No newline at end of file
@@ -0,0 +1,77 @@
+import datetime
+import gzip
+import json
+import os
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Action, ActionRollup
+
+
+def hot_horizon():
+    return timezone.now() - datetime.timedelta(days=settings.ACTION_HOT_DAYS)
+
+
+def hot_actions():
+    # feeds never read past the horizon, so old rows are left alone by
+    # their queries
+    return Action.objects.filter(created__gte=hot_horizon())
+
+
+def open_archive(directory):
+    os.makedirs(directory, exist_ok=True)
+    name = timezone.now().strftime('actions-%Y%m%dT%H%M%S.jsonl.gz')
+    return gzip.open(os.path.join(directory, name), 'wt', encoding='utf-8')
+
+
+def rollup_batch(rows):
+    counts = Counter((user_id, timezone.localtime(created).date(), verb)
+                     for id, user_id, verb, created, target_ct_id, target_id in rows)
+    existing = ActionRollup.objects.select_for_update().filter(
+        user_id__in={user_id for user_id, day, verb in counts},
+        day__in={day for user_id, day, verb in counts})
+    updated = []
+    for rollup in existing:
+        key = (rollup.user_id, rollup.day, rollup.verb)
+        if key in counts:
+            rollup.count += counts.pop(key)
+            updated.append(rollup)
+    ActionRollup.objects.bulk_update(updated, ['count'])
+    ActionRollup.objects.bulk_create([
+        ActionRollup(user_id=user_id, day=day, verb=verb, count=count)
+        for (user_id, day, verb), count in counts.items()])
+
+
+def rollup_actions(horizon=None, batch_size=5000, archive=None, pause=0, progress=None):
+    """
+    Fold actions created before the horizon into ActionRollup counts and
+    delete them, batch by batch. Each batch is its own short transaction so
+    locks are held briefly and the feed keeps being served. Deleted rows
+    are written to the archive file first, when one is given.
+    """
+    horizon = horizon or hot_horizon()
+    done = 0
+    while True:
+        with transaction.atomic():
+            rows = list(Action.objects.filter(created__lt=horizon).order_by('id').values_list(
+                'id', 'user_id', 'verb', 'created', 'target_ct_id', 'target_id')[:batch_size])
+            if not rows:
+                break
+            rollup_batch(rows)
+            if archive:
+                for id, user_id, verb, created, target_ct_id, target_id in rows:
+                    archive.write(json.dumps({
+                        'id': id, 'user_id': user_id, 'verb': verb, 'created': created.isoformat(),
+                        'target_ct_id': target_ct_id, 'target_id': target_id}) + '\n')
+            Action.objects.filter(id__in=[row[0] for row in rows]).delete()
+        done += len(rows)
+        if progress:
+            progress(done)
+        if pause:
+            # let replication and autovacuum keep up
+            time.sleep(pause)
+    return done
@@ -0,0 +1,14 @@
+from celery import shared_task
+from django.conf import settings
+from .retention import open_archive, rollup_actions
+
+
+@shared_task
+def rollup_actions_task():
+    archive = open_archive(settings.ACTION_ARCHIVE_DIR) if settings.ACTION_ARCHIVE_DIR else None
+    try:
+        done = rollup_actions(archive=archive)
+    finally:
+        if archive:
+            archive.close()
+    return done
@@ -1,3 +1,87 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core import events, redis_client
+from core.tests import RedisServerMixin
+from .models import Action, ActionRollup
+from .retention import open_archive, rollup_actions
+from .utils import create_action
+
+
+class PublishActionTests(RedisServerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('ann')
+        self.pubsub = redis_client.get_redis().pubsub(ignore_subscribe_messages=True)
+        self.addCleanup(self.pubsub.close)
+        self.pubsub.subscribe(events.ALL_ACTIONS_CHANNEL)
+        self.pubsub.get_message(timeout=1)
+
+    def create(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(create_action(self.user, 'is following', User.objects.create_user('bob')))
+        return self.pubsub.get_message(timeout=0.2)
+
+    @override_settings(SERVER_MODE='asgi')
+    def test_published_under_asgi(self):
+        message = self.create()
+        self.assertIn(b'event: action', message['data'])
+        self.assertIn(b'is following', message['data'])
+
+    @override_settings(SERVER_MODE='wsgi')
+    def test_nothing_published_under_wsgi(self):
+        self.assertIsNone(self.create())
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.ann = User.objects.create_user('ann')
+        self.bob = User.objects.create_user('bob')
+        self.now = timezone.now()
+
+    def add(self, user, verb, days_ago, count=1):
+        created = self.now - datetime.timedelta(days=days_ago)
+        for i in range(count):
+            action = Action.objects.create(user=user, verb=verb)
+            # auto_now_add ignores a given value
+            Action.objects.filter(id=action.id).update(created=created)
+        return timezone.localtime(created).date()
+
+    def rollups(self):
+        return {(r.user.username, r.day, r.verb): r.count for r in ActionRollup.objects.all()}
+
+    def test_batches_are_merged(self):
+        day = self.add(self.ann, 'likes', 100, count=3)
+        other_day = self.add(self.ann, 'bookmarked image', 120)
+        self.add(self.bob, 'likes', 120, count=2)
+        self.add(self.ann, 'likes', 10)
+        # a rollup left by an earlier run
+        ActionRollup.objects.create(user=self.ann, day=day, verb='likes', count=4)
+        horizon = self.now - datetime.timedelta(days=90)
+        self.assertEqual(rollup_actions(horizon, batch_size=2), 6)
+        self.assertEqual(self.rollups(), {
+            ('ann', day, 'likes'): 7,
+            ('ann', other_day, 'bookmarked image'): 1,
+            # also matched by the user and day filters, kept apart
+            ('bob', other_day, 'likes'): 2,
+        })
+        self.assertEqual(list(Action.objects.values_list('verb', flat=True)), ['likes'])
+        self.assertEqual(rollup_actions(horizon), 0)
+
+    def test_archive(self):
+        self.add(self.ann, 'likes', 100, count=2)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open_archive(directory) as archive:
+            rollup_actions(batch_size=1, archive=archive)
+        with gzip.open(os.path.join(directory, os.listdir(directory)[0]), 'rt') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([(row['user_id'], row['verb']) for row in rows], [(self.ann.id, 'likes')] * 2)
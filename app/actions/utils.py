@@ -1,9 +1,19 @@
 import datetime
+from django.db import transaction
+from django.template.loader import render_to_string
 from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
+from core import events
 from .models import Action
 
 
+def publish_action(action):
+    # rendered once for all the dashboards it is pushed to
+    html = render_to_string('actions/action/detail.html', {'action': action})
+    events.publish([events.user_channel(action.user_id), events.ALL_ACTIONS_CHANNEL],
+                   'action', {'user': action.user_id, 'html': html})
+
+
 def create_action(user, verb, target=None):
     # Check for any similar action made in the last minute
     now = timezone.now()
@@ -18,5 +28,7 @@ def create_action(user, verb, target=None):
         # No existing actions found
         action = Action(user=user, verb=verb, target=target)
         action.save()
+        if events.enabled():
+            transaction.on_commit(lambda: publish_action(action))
         return True
     return False
\ No newline at end of file
@@ -9,8 +9,23 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bookmarks.settings")
+os.environ.setdefault("SERVER_MODE", "asgi")
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+# imported once Django is set up
+from core import sse  # noqa: E402
+from core.asgi import ASGIHandler  # noqa: E402
+
+# streams responses from the request's thread, see core/asgi.py
+django_application = ASGIHandler()
+
+
+async def application(scope, receive, send):
+    # long lived event streams bypass Django, see core/sse.py
+    if sse.is_event_stream(scope):
+        return await sse.application(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,17 @@
+import os
+from celery import Celery
+from celery.signals import worker_process_init
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bookmarks.settings")
+
+app = Celery("bookmarks")
+# read the CELERY_* settings from the Django settings module
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
+
+
+@worker_process_init.connect
+def warm_hash_index(**kwargs):
+    # imports look up duplicates, load the index before the first one
+    from images import dedup
+    dedup.hash_index.warm()
@@ -10,10 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 import os
-import redis
 from pathlib import Path
 from django.urls import reverse_lazy
 from dotenv import load_dotenv
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -35,6 +35,25 @@ CSRF_TRUSTED_ORIGINS = os.getenv("CSRF_TRUSTED_ORIGINS", "").split(",")
 # Managing file uploads and serving media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# how media is sent: "django" streams the file itself, "x-accel" (nginx) and
+# "x-sendfile" (apache, lighttpd) let the front proxy send it
+MEDIA_SERVE_MODE = os.getenv('MEDIA_SERVE_MODE', 'django')
+# internal nginx location aliased to MEDIA_ROOT, for x-accel
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_REQUIRE_LOGIN = os.getenv('MEDIA_REQUIRE_LOGIN', '0') == '1'
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', 60 * 60 * 24 * 30))
+
+# Widths of the responsive image variants generated on upload, AVIF is only
+# produced when enabled and supported by the installed Pillow
+IMAGE_VARIANT_WIDTHS = [320, 640, 960, 1280]
+IMAGE_VARIANT_AVIF = os.getenv('IMAGE_VARIANT_AVIF', '0') == '1'
+# max differing bits between the perceptual hashes of near duplicate images;
+# lookups take about 0.1 ms on a million images up to 5, ten times more from 6
+IMAGE_DUPLICATE_DISTANCE = int(os.getenv('IMAGE_DUPLICATE_DISTANCE', 5))
+# profile photos are downscaled to this size on upload, square avatars of
+# each of the sizes are then generated by a worker
+AVATAR_MAX_SIZE = 800
+AVATAR_SIZES = [80, 180]
 
 
 ABSOLUTE_URL_OVERRIDES = {
@@ -180,7 +199,88 @@ INTERNAL_IPS = [
     '127.0.0.1',
 ]
 
+# "asgi" when served by bookmarks.asgi (see gunicorn.conf.py), "wsgi" otherwise
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
+
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")  # Default to localhost for development
 
-# Parse Redis URL
-REDIS_CONFIG = redis.from_url(REDIS_URL)
+# shared client pools, see core/redis_client.py. Request paths give up
+# quickly and fall back to degraded mode rather than wait on a slow Redis
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "0.5"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.5"))
+REDIS_JOB_TIMEOUT = float(os.getenv("REDIS_JOB_TIMEOUT", "30"))
+# consecutive failures that open the circuit, and seconds it stays open
+REDIS_BREAKER_THRESHOLD = int(os.getenv("REDIS_BREAKER_THRESHOLD", "5"))
+REDIS_BREAKER_COOLDOWN = float(os.getenv("REDIS_BREAKER_COOLDOWN", "10"))
+
+# token buckets of the write endpoints, see core/ratelimit.py: up to burst
+# requests at once, refilled at rate. Buckets are per user, or per IP when
+# "key" is "ip" or the request is anonymous
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# addresses or networks of the reverse proxies in front of the app (e.g.
+# "127.0.0.1,10.0.0.0/8"): for requests they pass on, the client address is
+# read from X-Forwarded-For
+RATE_LIMIT_TRUSTED_PROXIES = [p for p in os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "").split(",") if p]
+RATE_LIMITS = {
+    "image_create": {"rate": "60/h", "burst": 10},
+    "api_bookmarks": {"rate": "60/h", "burst": 10},
+    "image_like": {"rate": "30/m", "burst": 20},
+    "user_follow": {"rate": "20/m", "burst": 10},
+}
+# bearer token that lets a scraper read /metrics/ratelimit/, staff users
+# can always read it
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Server-Sent Events, only served under ASGI (SERVER_MODE=asgi): seconds
+# between keep-alive comments, reconnect delay in milliseconds, open
+# streams per worker, undelivered events kept per stream and followed
+# users whose actions a dashboard stream gets
+SSE_HEARTBEAT = int(os.getenv("SSE_HEARTBEAT", "25"))
+SSE_RETRY = int(os.getenv("SSE_RETRY", "5000"))
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", "5000"))
+SSE_QUEUE_SIZE = 32
+SSE_MAX_FOLLOWED = 1000
+
+# Celery runs the background jobs, using Redis as broker and result store
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", REDIS_URL)
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", REDIS_URL)
+CELERY_TASK_ALWAYS_EAGER = os.getenv("CELERY_TASK_ALWAYS_EAGER", "0") == "1"
+CELERY_RESULT_EXPIRES = 60 * 60 * 24
+# periodic jobs, run by celery beat
+CELERY_BEAT_SCHEDULE = {
+    "compute-suggestions": {
+        "task": "account.tasks.compute_suggestions_task",
+        "schedule": crontab(minute=0, hour=3),
+    },
+    "compute-also-liked": {
+        "task": "images.tasks.compute_also_liked_task",
+        "schedule": crontab(minute=30, hour=3),
+    },
+    "snapshot-views": {
+        "task": "images.tasks.snapshot_views_task",
+        "schedule": crontab(minute="*/15"),
+    },
+    "rollup-actions": {
+        "task": "actions.tasks.rollup_actions_task",
+        "schedule": crontab(minute=0, hour=4),
+    },
+}
+
+# Bulk bookmark imports
+IMPORT_MAX_BOOKMARKS = 10000
+# browser exports embed the favicons, allow a few KB per bookmark
+IMPORT_MAX_FILE_SIZE = 20 * 1024 * 1024
+IMPORT_MAX_WORKERS = 16  # concurrent downloads per import
+IMPORT_MAX_PER_HOST = 2  # concurrent downloads from a single host
+IMPORT_MAX_IMAGE_SIZE = 10 * 1024 * 1024
+IMPORT_TIMEOUT = 10
+# images accepted by a single bookmarking API request
+API_MAX_BATCH = 50
+
+# Activity stream retention: actions older than this are rolled up into
+# per-user, per-day counts and removed, feeds only read newer ones
+ACTION_HOT_DAYS = int(os.getenv('ACTION_HOT_DAYS', 90))
+# directory for gzipped JSON lines copies of the removed actions, if set
+ACTION_ARCHIVE_DIR = os.getenv('ACTION_ARCHIVE_DIR', '')
@@ -0,0 +1,40 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers import asgi
+
+_done = object()
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """
+    Django 4.1 iterates streaming responses on the event loop: a generator
+    that queries the database fails once the headers are sent, and file
+    reads hold up every other request of the worker. This handler gets each
+    part in the request's thread instead, like the view itself ran.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            headers.append((b'Set-Cookie', cookie.output(header='').encode('ascii').strip()))
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        next_part = sync_to_async(next, thread_sensitive=True)
+        parts = iter(response)
+        try:
+            while True:
+                part = await next_part(parts, _done)
+                if part is _done:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            # also stops the generator when the client went away
+            await sync_to_async(response.close, thread_sensitive=True)()
@@ -0,0 +1,34 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponseNotAllowed
+
+
+# Django 4.1 only ships sync decorators, wrapping a coroutine view with them
+# makes Django treat it as a sync view that returns an unawaited coroutine.
+
+def async_login_required(view_func):
+    """
+    login_required for async views. Loads request.user in a thread so it can
+    be used from the view afterwards.
+    """
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+    return _wrapped_view
+
+
+def async_require_POST(view_func):
+    """
+    require_POST for async views.
+    """
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        return await view_func(request, *args, **kwargs)
+    return _wrapped_view
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import weakref
+from collections import defaultdict
+
+from django.conf import settings
+from redis import asyncio as aioredis
+
+from . import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Live updates go through Redis pub/sub, so every worker gets the events
+# published by any process. The messages are ready to send Server-Sent
+# Events frames, the workers pass them on untouched.
+
+
+def image_channel(image_id):
+    return f'events:image:{image_id}'
+
+
+def user_channel(user_id):
+    return f'events:user:{user_id}'
+
+
+# every action, for the dashboards of users who follow nobody
+ALL_ACTIONS_CHANNEL = 'events:actions'
+
+
+def frame(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def enabled():
+    # only ASGI workers serve the event streams, under WSGI nobody listens
+    return settings.SERVER_MODE == 'asgi'
+
+
+def publish(channels, event, data):
+    # best effort, live updates are skipped while Redis is unavailable
+    message = frame(event, data)
+
+    def run(r):
+        with r.pipeline(transaction=False) as pipe:
+            for channel in channels:
+                pipe.publish(channel, message)
+            pipe.execute()
+
+    redis_client.call(run)
+
+
+async def apublish(channel, event, data):
+    await redis_client.acall(lambda r: r.publish(channel, frame(event, data)))
+
+
+class EventHub:
+    """
+    Shares one pub/sub connection between all the event streams of a
+    worker. Streams register a queue for the channels they follow, the hub
+    subscribes to a channel while at least one queue wants it.
+    """
+
+    def __init__(self):
+        self.queues = defaultdict(set)
+        self.client = None
+        self.pubsub = None
+        self.reader = None
+
+    async def subscribe(self, channels, queue):
+        new = [channel for channel in channels if not self.queues[channel]]
+        for channel in channels:
+            self.queues[channel].add(queue)
+        if self.reader is None:
+            # subscribes to everything when it connects
+            self.reader = asyncio.ensure_future(self.run())
+        elif new and self.pubsub is not None:
+            await self.send(self.pubsub.subscribe, new)
+
+    async def unsubscribe(self, channels, queue):
+        gone = []
+        for channel in channels:
+            self.queues[channel].discard(queue)
+            if not self.queues[channel]:
+                del self.queues[channel]
+                gone.append(channel)
+        if gone and self.pubsub is not None:
+            await self.send(self.pubsub.unsubscribe, gone)
+
+    async def send(self, command, channels):
+        try:
+            await command(*channels)
+        except redis_client.UNAVAILABLE:
+            # the reader reconnects and subscribes again
+            pass
+
+    def dispatch(self, message):
+        for queue in self.queues.get(message['channel'].decode(), ()):
+            try:
+                queue.put_nowait(message['data'])
+            except asyncio.QueueFull:
+                # the client doesn't keep up, it misses this update
+                pass
+
+    async def connect(self):
+        if self.client is None:
+            # reads block for as long as nothing is published
+            self.client = aioredis.Redis.from_url(
+                settings.REDIS_URL, socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+                health_check_interval=30)
+        channels = set(self.queues)
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(*channels)
+        except redis_client.UNAVAILABLE:
+            await close_quietly(pubsub)
+            raise
+        # only shared once connected, other streams would otherwise make
+        # it open a second connection
+        self.pubsub = pubsub
+        # streams that came and went meanwhile
+        added = set(self.queues) - channels
+        removed = channels - set(self.queues)
+        if added:
+            await pubsub.subscribe(*added)
+        if removed:
+            await pubsub.unsubscribe(*removed)
+
+    async def run(self):
+        while self.queues:
+            try:
+                if self.pubsub is None:
+                    await self.connect()
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=10)
+                if message and message['type'] == 'message':
+                    self.dispatch(message)
+            except redis_client.UNAVAILABLE:
+                logger.warning('Event subscription lost, reconnecting', exc_info=True)
+                pubsub, self.pubsub = self.pubsub, None
+                await close_quietly(pubsub)
+                await asyncio.sleep(settings.SSE_RETRY / 1000)
+        # cleared before closing, a stream that subscribes meanwhile starts
+        # a new reader with a new connection
+        pubsub, self.pubsub, self.reader = self.pubsub, None, None
+        await close_quietly(pubsub)
+
+
+async def close_quietly(pubsub):
+    if pubsub is not None:
+        try:
+            await pubsub.close()
+        except redis_client.UNAVAILABLE:
+            pass
+
+
+# one hub per event loop, like the async clients
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = EventHub()
+    return hub
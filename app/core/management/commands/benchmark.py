@@ -0,0 +1,291 @@
+import inspect
+import io
+import json
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from unittest import mock
+
+import django
+import redis
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment, teardown_test_environment)
+from django.urls import reverse
+from redis import asyncio as aioredis
+
+from images.models import Image
+from core import redis_client
+from core.management.commands import seed_data
+
+# Allowed relative latency increase (p50 and p90) against a baseline run
+# before a view counts as regressed. Query counts, Redis calls and Redis
+# connections opened may never grow.
+DEFAULT_THRESHOLDS = {
+    'dashboard': 0.20,
+    'image_list': 0.20,
+    'image_list_deep': 0.30,
+    'image_detail': 0.20,
+    'image_like': 0.25,
+    'image_ranking': 0.20,
+    'user_list': 0.20,
+    'user_detail': 0.20,
+    'user_follow': 0.25,
+}
+
+
+class RedisCallCounter:
+    """
+    Count the round trips to Redis and the connections opened, by the sync
+    and async clients alike. A pipeline counts as a single call, health
+    check pings don't count.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.connections = 0
+
+    def counted(self, func, counter):
+        if inspect.iscoroutinefunction(func):
+            async def counted_call(*args, **kwargs):
+                if kwargs.get('check_health', True):
+                    setattr(self, counter, getattr(self, counter) + 1)
+                return await func(*args, **kwargs)
+        else:
+            def counted_call(*args, **kwargs):
+                if kwargs.get('check_health', True):
+                    setattr(self, counter, getattr(self, counter) + 1)
+                return func(*args, **kwargs)
+        return counted_call
+
+    def patches(self):
+        for connection_class in (redis.connection.AbstractConnection,
+                                 aioredis.connection.AbstractConnection):
+            yield mock.patch.object(connection_class, 'send_packed_command',
+                                    self.counted(connection_class.send_packed_command, 'calls'))
+            yield mock.patch.object(connection_class, 'on_connect',
+                                    self.counted(connection_class.on_connect, 'connections'))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway database and measure latency, query counts and '
+            'Redis calls of the hot views. Results can be saved as JSON and '
+            'compared against a previous run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--images', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Measured requests per view.')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Unmeasured requests per view, so thumbnails '
+                                 'and caches are generated first.')
+        parser.add_argument('--views', nargs='+', choices=list(DEFAULT_THRESHOLDS),
+                            help='Only benchmark these views.')
+        parser.add_argument('--redis-url',
+                            help='Use a real Redis server instead of fakeredis. '
+                                 'Its current database is flushed.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='Baseline JSON file to compare against.')
+        parser.add_argument('--threshold', action='append', default=[],
+                            metavar='VIEW=FRACTION',
+                            help='Override the allowed latency regression of a '
+                                 'view, e.g. image_list=0.5.')
+
+    def handle(self, *args, **options):
+        thresholds = dict(DEFAULT_THRESHOLDS)
+        for item in options['threshold']:
+            view, _, value = item.partition('=')
+            if view not in thresholds or not value:
+                raise CommandError(f'Invalid threshold "{item}".')
+            thresholds[view] = float(value)
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        redis_url, server = self.get_redis_url(options['redis_url'])
+        counter = RedisCallCounter()
+
+        # run from the test suite, the database already is a throwaway one
+        testing = hasattr(mail, 'outbox')
+        if not testing:
+            setup_test_environment(debug=False)
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root, REDIS_URL=redis_url,
+                                      # the repeated writes would be throttled
+                                      RATE_LIMIT_ENABLED=False,
+                                      STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'), \
+                    ExitStack() as patches:
+                for patch in counter.patches():
+                    patches.enter_context(patch)
+                # the clients are made for the benchmark's Redis
+                redis_client.reset()
+                self.stdout.write('Seeding the benchmark database...')
+                call_command(seed_data.Command(), users=options['users'], images=options['images'],
+                             seed=options['seed'], stdout=io.StringIO())
+                results = self.run_benchmarks(options, counter)
+        finally:
+            redis_client.reset()
+            if not testing:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+            if server:
+                server.shutdown()
+                server.server_close()
+
+        report = {
+            'meta': {
+                'users': options['users'],
+                'images': options['images'],
+                'seed': options['seed'],
+                'requests': options['requests'],
+                'database': connection.vendor,
+                'redis': 'redis' if options['redis_url'] else 'fakeredis',
+                'django': django.get_version(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            },
+            'views': results,
+        }
+        self.print_results(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+        if baseline:
+            regressions = self.compare(results, baseline, thresholds)
+            if regressions:
+                for message in regressions:
+                    self.stderr.write(message)
+                raise CommandError(f'{len(regressions)} regression(s) found.')
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def get_redis_url(self, redis_url):
+        # the views use the real client layer, against a fakeredis server
+        # listening on a free port unless a Redis server is given
+        if redis_url:
+            redis.Redis.from_url(redis_url).flushdb()
+            return redis_url, None
+        try:
+            from fakeredis import TcpFakeServer
+        except ImportError:
+            raise CommandError('fakeredis is not installed, install it or pass --redis-url.')
+        server = TcpFakeServer(('127.0.0.1', 0))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+        return f'redis://{host}:{port}/0', server
+
+    def get_scenarios(self):
+        # the most connected user gives the heaviest dashboard
+        user = User.objects.annotate(
+            n=Count('following')
+        ).order_by('-n', 'id').first()
+        author = User.objects.annotate(
+            n=Count('images_created')
+        ).order_by('-n', 'id').first()
+        other = User.objects.exclude(id=user.id).order_by('id').first()
+        images = list(Image.objects.order_by('-total_likes', 'id')[:20])
+        num_pages = max(1, (Image.objects.count() + 7) // 8)
+        toggles = {'like': 'unlike', 'unlike': 'like', 'follow': 'unfollow', 'unfollow': 'follow'}
+        state = {'like': 'like', 'follow': 'follow'}
+
+        def toggle(key):
+            action = state[key]
+            state[key] = toggles[action]
+            return action
+
+        scenarios = {
+            'dashboard': lambda c, i: c.get(reverse('dashboard')),
+            'image_list': lambda c, i: c.get(reverse('images:list')),
+            'image_list_deep': lambda c, i: c.get(reverse('images:list'),
+                                                  {'page': num_pages - i % 10}),
+            'image_detail': lambda c, i: c.get(images[i % len(images)].get_absolute_url()),
+            'image_like': lambda c, i: c.post(reverse('images:like'),
+                                              {'id': images[0].id, 'action': toggle('like')}),
+            'image_ranking': lambda c, i: c.get(reverse('images:ranking')),
+            'user_list': lambda c, i: c.get(reverse('user_list')),
+            'user_detail': lambda c, i: c.get(author.get_absolute_url()),
+            'user_follow': lambda c, i: c.post(reverse('user_follow'),
+                                               {'id': other.id, 'action': toggle('follow')}),
+        }
+        return user, scenarios
+
+    def run_benchmarks(self, options, counter):
+        user, scenarios = self.get_scenarios()
+        client = Client()
+        client.force_login(user)
+        results = {}
+        for name, request in scenarios.items():
+            if options['views'] and name not in options['views']:
+                continue
+            for i in range(options['warmup']):
+                request(client, i)
+            timings, queries, redis_calls, redis_connections = [], [], [], []
+            for i in range(options['requests']):
+                counter.calls = counter.connections = 0
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    response = request(client, i)
+                    timings.append((time.perf_counter() - start) * 1000)
+                if response.status_code >= 400:
+                    raise CommandError(f'{name} returned HTTP {response.status_code}.')
+                queries.append(len(ctx.captured_queries))
+                redis_calls.append(counter.calls)
+                redis_connections.append(counter.connections)
+            results[name] = {
+                'p50_ms': round(percentile(timings, 50), 3),
+                'p90_ms': round(percentile(timings, 90), 3),
+                'p99_ms': round(percentile(timings, 99), 3),
+                'mean_ms': round(statistics.mean(timings), 3),
+                'queries': max(queries),
+                'redis_calls': max(redis_calls),
+                'redis_connections': max(redis_connections),
+            }
+        return results
+
+    def print_results(self, results, baseline=None):
+        header = f'{"view":<18}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"queries":>9}{"redis":>7}{"conns":>7}'
+        self.stdout.write(header)
+        for name, result in results.items():
+            line = (f'{name:<18}{result["p50_ms"]:>10.2f}{result["p90_ms"]:>10.2f}'
+                    f'{result["p99_ms"]:>10.2f}{result["queries"]:>9}{result["redis_calls"]:>7}'
+                    f'{result["redis_connections"]:>7}')
+            previous = baseline and baseline['views'].get(name)
+            if previous:
+                change = (result['p50_ms'] - previous['p50_ms']) / previous['p50_ms']
+                line += f'  ({change:+.0%} p50)'
+            self.stdout.write(line)
+
+    def compare(self, results, baseline, thresholds):
+        regressions = []
+        for name, result in results.items():
+            previous = baseline['views'].get(name)
+            if not previous:
+                continue
+            for metric in ('p50_ms', 'p90_ms'):
+                limit = previous[metric] * (1 + thresholds[name])
+                if result[metric] > limit:
+                    regressions.append(f'{name}: {metric} {result[metric]:.2f} exceeds '
+                                       f'{limit:.2f} (baseline {previous[metric]:.2f})')
+            for metric in ('queries', 'redis_calls', 'redis_connections'):
+                # older baselines don't have every metric
+                if metric in previous and result[metric] > previous[metric]:
+                    regressions.append(f'{name}: {metric} grew from {previous[metric]} '
+                                       f'to {result[metric]}')
+        return regressions
@@ -0,0 +1,259 @@
+import datetime
+import io
+import random
+from array import array
+from contextlib import contextmanager
+
+from PIL import Image as PILImage, ImageDraw
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from account.models import Profile, Contact
+from actions.models import Action
+from core.redis_client import get_job_redis
+from images.models import Image
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    # allow bulk_create to keep the generated dates instead of "now"
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Generate a synthetic dataset of users, follows, images, likes, '
+            'actions and Redis view counters. The output is deterministic '
+            'for a given seed.')
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--images', type=int, default=5000)
+        parser.add_argument('--avg-follows', type=float, default=20,
+                            help='Average number of users each user follows.')
+        parser.add_argument('--avg-likes', type=float, default=30,
+                            help='Average number of images each user likes.')
+        parser.add_argument('--avg-views', type=float, default=50,
+                            help='Average number of views per image.')
+        parser.add_argument('--skew', type=float, default=2.5,
+                            help='Popularity skew of the follow and like '
+                                 'graphs, 1 is uniform.')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Spread timestamps over this many days.')
+        parser.add_argument('--files', type=int, default=20,
+                            help='Number of distinct image files to generate '
+                                 'and share between the image rows.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='pixmark',
+                            help='Password set on every generated user.')
+        parser.add_argument('--no-redis', action='store_true',
+                            help='Skip the Redis view and ranking state, only set Image.views.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.seed = options['seed']
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.prefix = f'seed{self.seed}_'
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(f'Users prefixed "{self.prefix}" already '
+                               'exist, pick another --seed.')
+        n_users, n_images = options['users'], options['images']
+        if n_users < 2:
+            raise CommandError('At least two users are needed.')
+
+        files = self.generate_files(options['files'])
+        with explicit_timestamps(Contact._meta.get_field('created'),
+                                 Image._meta.get_field('created'),
+                                 Action._meta.get_field('created')):
+            user_ids = self.create_users(n_users, files)
+            self.create_contacts(user_ids)
+            image_ids = self.create_images(user_ids, n_images, files)
+            self.create_likes(user_ids, image_ids)
+        self.create_views(image_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(user_ids)} users and {len(image_ids)} images.'))
+
+    def rng(self, stream):
+        # independent deterministic random stream per generation stage
+        return random.Random(f'{self.seed}:{stream}')
+
+    def popular(self, rng, n, k, exclude=None):
+        # pick up to k distinct indexes in [0, n) with a power-law bias
+        # towards low indexes
+        picked = set()
+        skew = self.options['skew']
+        for _ in range(k * 10):
+            if len(picked) >= k:
+                break
+            idx = int(n * rng.random() ** skew)
+            if idx != exclude:
+                picked.add(idx)
+        return picked
+
+    def random_date(self, rng):
+        days = self.options['days']
+        return self.now - datetime.timedelta(seconds=rng.random() * days * 86400)
+
+    def batched(self, objs, model, **kwargs):
+        batch = []
+        for obj in objs:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch, **kwargs)
+                yield batch
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch, **kwargs)
+            yield batch
+
+    def generate_files(self, count):
+        rng = self.rng('files')
+        names = []
+        for i in range(count):
+            img = PILImage.new('RGB', (640, 480), tuple(rng.randrange(256) for _ in range(3)))
+            draw = ImageDraw.Draw(img)
+            for _ in range(12):
+                x, y = rng.randrange(640), rng.randrange(480)
+                draw.rectangle([x, y, x + rng.randrange(40, 300), y + rng.randrange(40, 300)],
+                               fill=tuple(rng.randrange(256) for _ in range(3)))
+            buffer = io.BytesIO()
+            img.save(buffer, 'JPEG', quality=80)
+            name = f'images/seed/{self.prefix}{i}.jpg'
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            names.append(default_storage.save(name, ContentFile(buffer.getvalue())))
+        return names
+
+    def create_users(self, count, files):
+        rng = self.rng('users')
+        password = make_password(self.options['password'])
+        users = (User(username=f'{self.prefix}{i}',
+                      first_name=f'User{i}',
+                      email=f'{self.prefix}{i}@example.com',
+                      password=password,
+                      date_joined=self.random_date(rng))
+                 for i in range(count))
+        user_ids = []
+        for batch in self.batched(users, User):
+            ids = [user.id for user in batch]
+            with transaction.atomic():
+                Profile.objects.bulk_create(
+                    Profile(user_id=user_id,
+                            photo=rng.choice(files) if files and rng.random() < 0.5 else '')
+                    for user_id in ids)
+                Action.objects.bulk_create(
+                    Action(user_id=user.id, verb='has created an account',
+                           created=user.date_joined)
+                    for user in batch)
+            user_ids.extend(ids)
+            self.stdout.write(f'users: {len(user_ids)}/{count}')
+        return user_ids
+
+    def create_contacts(self, user_ids):
+        rng = self.rng('contacts')
+        n = len(user_ids)
+        avg = self.options['avg_follows']
+        user_ct = ContentType.objects.get_for_model(User)
+
+        def contacts():
+            for idx, user_from in enumerate(user_ids):
+                degree = int(rng.expovariate(1 / avg)) if avg else 0
+                for target_idx in sorted(self.popular(rng, n, degree, exclude=idx)):
+                    yield Contact(user_from_id=user_from, user_to_id=user_ids[target_idx],
+                                  created=self.random_date(rng))
+
+        total = 0
+        for batch in self.batched(contacts(), Contact):
+            Action.objects.bulk_create(
+                Action(user_id=c.user_from_id, verb='is following',
+                       target_ct=user_ct, target_id=c.user_to_id, created=c.created)
+                for c in batch)
+            total += len(batch)
+            self.stdout.write(f'contacts: {total}')
+
+    def iter_likes(self, n_users, n_images):
+        # replayable, so likes can be counted before the images exist
+        rng = self.rng('likes')
+        avg = self.options['avg_likes']
+        for user_idx in range(n_users):
+            degree = int(rng.expovariate(1 / avg)) if avg else 0
+            for image_idx in sorted(self.popular(rng, n_images, degree)):
+                yield user_idx, image_idx
+
+    def create_images(self, user_ids, count, files):
+        rng = self.rng('images')
+        total_likes = array('L', [0]) * count
+        for _, image_idx in self.iter_likes(len(user_ids), count):
+            total_likes[image_idx] += 1
+        image_ct = ContentType.objects.get_for_model(Image)
+
+        def images():
+            for i in range(count):
+                title = f'Image {self.prefix}{i}'
+                owner = self.popular(rng, len(user_ids), 1).pop()
+                yield Image(user_id=user_ids[owner],
+                            title=title,
+                            slug=title.lower().replace(' ', '-'),
+                            url=f'https://example.com/{self.prefix}{i}.jpg',
+                            image=files[i % len(files)] if files else '',
+                            description=f'Synthetic image number {i}.',
+                            created=self.random_date(rng).date(),
+                            total_likes=total_likes[i])
+
+        image_ids = []
+        for batch in self.batched(images(), Image):
+            Action.objects.bulk_create(
+                Action(user_id=image.user_id, verb='bookmarked image',
+                       target_ct=image_ct, target_id=image.id,
+                       created=datetime.datetime.combine(
+                           image.created, datetime.time(), datetime.timezone.utc))
+                for image in batch)
+            image_ids.extend(image.id for image in batch)
+            self.stdout.write(f'images: {len(image_ids)}/{count}')
+        return image_ids
+
+    def create_likes(self, user_ids, image_ids):
+        rng = self.rng('like-dates')
+        through = Image.users_like.through
+        image_ct = ContentType.objects.get_for_model(Image)
+        likes = (through(user_id=user_ids[user_idx], image_id=image_ids[image_idx])
+                 for user_idx, image_idx in self.iter_likes(len(user_ids), len(image_ids)))
+        total = 0
+        for batch in self.batched(likes, through):
+            Action.objects.bulk_create(
+                Action(user_id=like.user_id, verb='likes', target_ct=image_ct,
+                       target_id=like.image_id, created=self.random_date(rng))
+                for like in batch)
+            total += len(batch)
+            self.stdout.write(f'likes: {total}')
+
+    def create_views(self, image_ids):
+        rng = self.rng('views')
+        r = None if self.options['no_redis'] else get_job_redis()
+        avg = self.options['avg_views']
+        for start in range(0, len(image_ids), self.batch_size):
+            counts = {image_id: int(rng.paretovariate(1.5) * avg / 3)
+                      for image_id in image_ids[start:start + self.batch_size]}
+            # Image.views holds what the last snapshot_views run copied
+            Image.objects.bulk_update([Image(id=image_id, views=views) for image_id, views in counts.items()],
+                                      ['views'])
+            if r is None:
+                continue
+            pipe = r.pipeline(transaction=False)
+            for image_id, views in counts.items():
+                pipe.set(f'image:{image_id}:views', views)
+            pipe.zadd('image_ranking', counts)
+            pipe.execute()
+        self.stdout.write(f'views: {len(image_ids)}')
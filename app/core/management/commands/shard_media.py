@@ -0,0 +1,99 @@
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from account.avatars import avatar_name
+from account.models import Profile
+from core.storage import is_sharded, moved_name
+from images.models import Image
+
+
+class Command(BaseCommand):
+    help = 'Move existing uploads from date based directories to the sharded layout.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many files would be moved.')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.batch_size = options['batch_size']
+        # old name -> new name, identical copies share one file
+        self.moved = {}
+        self.missing = 0
+        self.renamed = False
+        images = self.shard(Image.objects.exclude(image=''), 'image', 'images', ['image', 'variants'])
+        photos = self.shard(Profile.objects.exclude(photo=''), 'photo', 'users', ['photo', 'avatars'])
+        verb = 'Would move' if self.dry_run else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} the files of {images} images and {photos} profiles, {self.missing} missing.'))
+
+    def move(self, name, new):
+        if name in self.moved:
+            return self.moved[name]
+        if self.dry_run:
+            return new
+        if default_storage.exists(name):
+            if default_storage.exists(new):
+                # never overwrite, the row is saved right away so a resumed
+                # run doesn't look for the file under the usual name
+                new = default_storage.get_available_name(new)
+                self.renamed = True
+            try:
+                # rename in place on the local file system
+                path = default_storage.path(new)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(default_storage.path(name), path)
+            except NotImplementedError:
+                with default_storage.open(name, 'rb') as f:
+                    saved = default_storage.save(new, f)
+                if saved != new:
+                    new = saved
+                    self.renamed = True
+                default_storage.delete(name)
+        elif not default_storage.exists(new):
+            self.missing += 1
+            self.stderr.write(f'Missing file {name}')
+        self.moved[name] = new
+        return new
+
+    def moved_variant(self, variant, name, new):
+        # variants are named after the original and live next to it
+        base, new_base = os.path.splitext(name)[0], os.path.splitext(new)[0]
+        if variant.startswith(base + '_'):
+            return self.move(variant, new_base + variant[len(base):])
+        return self.move(variant, moved_name('images', variant))
+
+    def shard(self, queryset, field, prefix, update_fields):
+        batch = []
+        count = 0
+        for obj in queryset.order_by('pk').iterator(chunk_size=self.batch_size):
+            name = getattr(obj, field).name
+            if is_sharded(name):
+                continue
+            # derived from the old name, so an interrupted run can resume
+            new = self.move(name, moved_name(prefix, name))
+            if field == 'photo' and obj.avatars:
+                # avatar names follow the photo's
+                obj.avatars = {size: default_storage.url(self.move(avatar_name(name, size),
+                                                                   avatar_name(new, size)))
+                               for size in obj.avatars}
+            getattr(obj, field).name = new
+            if field == 'image' and obj.variants:
+                obj.variants = {
+                    fmt: [[width, self.moved_variant(variant, name, new)]
+                          for width, variant in variants]
+                    for fmt, variants in obj.variants.items()}
+            batch.append(obj)
+            count += 1
+            if len(batch) == self.batch_size or self.renamed:
+                self.save(queryset.model, batch, update_fields)
+        self.save(queryset.model, batch, update_fields)
+        return count
+
+    def save(self, model, batch, fields):
+        if batch and not self.dry_run:
+            model.objects.bulk_update(batch, fields)
+        batch.clear()
+        self.renamed = False
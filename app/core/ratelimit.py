@@ -0,0 +1,161 @@
+import asyncio
+import ipaddress
+import logging
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from redis.commands.core import AsyncScript, Script
+
+from . import redis_client
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+STATS_KEY = 'ratelimit:stats'
+
+# Token bucket, refilled continuously at rate tokens per second up to
+# capacity. Takes a token and counts the decision in one round trip.
+# KEYS: bucket, decision counters. ARGV: capacity, rate, now, endpoint.
+# Returns the seconds to wait for the next token, "0" when allowed.
+BUCKET_SCRIPT = b"""
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    redis.call('HINCRBY', KEYS[2], ARGV[4] .. ':allowed', 1)
+else
+    wait = (1 - tokens) / rate
+    redis.call('HINCRBY', KEYS[2], ARGV[4] .. ':limited', 1)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+# loaded once per server with SCRIPT LOAD, then called by its hash
+bucket_script = Script(None, BUCKET_SCRIPT)
+async_bucket_script = AsyncScript(None, BUCKET_SCRIPT)
+
+
+def parse_rate(rate):
+    # "60/m" -> tokens per second
+    count, _, period = rate.partition('/')
+    return int(count) / PERIODS[period[0]]
+
+
+def get_limit(name):
+    if not settings.RATE_LIMIT_ENABLED:
+        return None
+    return settings.RATE_LIMITS.get(name)
+
+
+def is_trusted_proxy(address):
+    try:
+        address = ipaddress.ip_address(address.strip())
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(proxy, strict=False)
+               for proxy in settings.RATE_LIMIT_TRUSTED_PROXIES)
+
+
+def client_ip(request):
+    """
+    The address of the client: REMOTE_ADDR, or when that is a trusted proxy,
+    the last X-Forwarded-For entry not added by a trusted proxy. Entries
+    further left are set by the client and can be forged.
+    """
+    address = request.META.get('REMOTE_ADDR', '')
+    if not is_trusted_proxy(address):
+        return address
+    for forwarded in reversed(request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')):
+        address = forwarded.strip() or address
+        if not is_trusted_proxy(address):
+            break
+    return address
+
+
+def bucket_key(request, name, limit):
+    user = request.user
+    if limit.get('key', 'user') == 'user' and user.is_authenticated:
+        return f'ratelimit:{name}:user:{user.pk}'
+    return f'ratelimit:{name}:ip:{client_ip(request)}'
+
+
+def script_args(name, limit):
+    return [limit['burst'], parse_rate(limit['rate']), repr(time.time()), name]
+
+
+def decide(name, wait):
+    # None when Redis is unavailable: let the request through
+    if wait is None:
+        return 0
+    wait = float(wait)
+    if wait:
+        logger.info('Rate limited %s, next token in %.1fs', name, wait)
+    return wait
+
+
+def too_many_requests(request, wait):
+    retry_after = max(1, math.ceil(wait))
+    if 'text/html' in request.headers.get('Accept', ''):
+        response = HttpResponse(f'Too many requests, try again in {retry_after} seconds.',
+                                content_type='text/plain', status=429)
+    else:
+        response = JsonResponse({'status': 'error', 'error': 'Too many requests.'}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def rate_limit(name):
+    """
+    Throttle the POST requests of a view with the token bucket configured in
+    RATE_LIMITS[name], per user (or IP for anonymous requests) unless the
+    entry sets "key" to "ip". Goes under the login decorators, so the user
+    is already loaded for async views.
+    """
+    def decorator(view_func):
+        if asyncio.iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _wrapped_view(request, *args, **kwargs):
+                limit = get_limit(name)
+                if limit and request.method == 'POST':
+                    keys = [bucket_key(request, name, limit), STATS_KEY]
+                    wait = decide(name, await redis_client.acall(
+                        lambda r: async_bucket_script(keys, script_args(name, limit), client=r)))
+                    if wait:
+                        return too_many_requests(request, wait)
+                return await view_func(request, *args, **kwargs)
+        else:
+            @wraps(view_func)
+            def _wrapped_view(request, *args, **kwargs):
+                limit = get_limit(name)
+                if limit and request.method == 'POST':
+                    keys = [bucket_key(request, name, limit), STATS_KEY]
+                    wait = decide(name, redis_client.call(
+                        lambda r: bucket_script(keys, script_args(name, limit), client=r)))
+                    if wait:
+                        return too_many_requests(request, wait)
+                return view_func(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
+
+
+def decision_counts():
+    """
+    {(endpoint, decision): count} of every limiter decision so far.
+    """
+    stats = redis_client.call(lambda r: r.hgetall(STATS_KEY), default={})
+    counts = {}
+    for field, value in stats.items():
+        name, _, decision = field.decode().rpartition(':')
+        counts[(name, decision)] = int(value)
+    return counts
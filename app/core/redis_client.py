@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+
+import redis
+from django.conf import settings
+from redis import asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+# what a call may raise when Redis is down, slow or out of connections,
+# only these count towards opening the circuit
+UNAVAILABLE = (redis.ConnectionError, redis.TimeoutError, OSError, asyncio.TimeoutError)
+
+
+class CircuitBreaker:
+    """
+    Stop calling Redis after a run of failures, so requests fail fast
+    instead of each waiting for a timeout. After the cooldown one call is
+    let through, its result closes or reopens the circuit.
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            # half open: the other callers wait another cooldown while
+            # this one tries
+            self.opened_at = time.monotonic()
+            return True
+
+    def success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info('Redis is back, closing the circuit')
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning('Redis is unavailable, opening the circuit for %ss', self.cooldown)
+                self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker(settings.REDIS_BREAKER_THRESHOLD, settings.REDIS_BREAKER_COOLDOWN)
+
+_lock = threading.Lock()
+_clients = {}
+# async connections are bound to the event loop that opened them, so
+# keep one client per loop
+_async_clients = weakref.WeakKeyDictionary()
+# runs the async calls of WSGI workers, see get_redis_loop()
+_loop = None
+
+
+def pool_options(socket_timeout):
+    return {
+        'max_connections': settings.REDIS_MAX_CONNECTIONS,
+        # how long to wait for a free connection once the pool is exhausted
+        'timeout': settings.REDIS_POOL_TIMEOUT,
+        'socket_timeout': socket_timeout,
+        'socket_connect_timeout': settings.REDIS_CONNECT_TIMEOUT,
+        'health_check_interval': 30,
+    }
+
+
+def _sync_client(name, socket_timeout):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                pool = redis.BlockingConnectionPool.from_url(settings.REDIS_URL,
+                                                             **pool_options(socket_timeout))
+                client = _clients[name] = redis.Redis(connection_pool=pool)
+    return client
+
+
+def get_redis():
+    """
+    The client for request paths, with short timeouts.
+    """
+    return _sync_client('default', settings.REDIS_SOCKET_TIMEOUT)
+
+
+def get_job_redis():
+    """
+    The client for batch jobs, whose big pipelines need longer timeouts.
+    """
+    return _sync_client('jobs', settings.REDIS_JOB_TIMEOUT)
+
+
+def get_async_redis():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        pool = aioredis.BlockingConnectionPool.from_url(settings.REDIS_URL,
+                                                        **pool_options(settings.REDIS_SOCKET_TIMEOUT))
+        client = _async_clients[loop] = aioredis.Redis(connection_pool=pool)
+    return client
+
+
+def get_redis_loop():
+    """
+    An event loop running in a thread of its own. Under WSGI every request
+    runs its async view in a new loop, whose connections couldn't be
+    reused, so the views' Redis calls go through this one instead.
+    """
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='redis-loop', daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def reset():
+    # a forked worker must not share the parent's sockets, nor use its loop
+    # thread, which doesn't exist in the child
+    global _lock, _loop
+    _lock = threading.Lock()
+    _loop = None
+    _clients.clear()
+    _async_clients.clear()
+    breaker.__init__(breaker.threshold, breaker.cooldown)
+
+
+os.register_at_fork(after_in_child=reset)
+
+
+def call(func, default=None):
+    """
+    Return func(client), or default when Redis fails or the circuit is open.
+    Only an unavailable Redis counts towards opening the circuit: a command
+    error (a wrong type, a script bug) is the caller's, and opening the
+    circuit for it would turn off every Redis feature of the process.
+    """
+    if not breaker.allow():
+        return default
+    try:
+        result = func(get_redis())
+    except UNAVAILABLE:
+        logger.warning('Redis call failed', exc_info=True)
+        breaker.failure()
+        return default
+    except redis.RedisError:
+        # a command error, Redis itself is fine
+        logger.exception('Redis command failed')
+        return default
+    breaker.success()
+    return result
+
+
+async def acall(func, default=None):
+    """
+    Async call(), func(client) returns an awaitable.
+    """
+    if not breaker.allow():
+        return default
+
+    async def run():
+        return await func(get_async_redis())
+
+    try:
+        if settings.SERVER_MODE == 'asgi':
+            result = await run()
+        else:
+            result = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(run(), get_redis_loop()))
+    except UNAVAILABLE:
+        logger.warning('Redis call failed', exc_info=True)
+        breaker.failure()
+        return default
+    except redis.RedisError:
+        # a command error, Redis itself is fine
+        logger.exception('Redis command failed')
+        return default
+    breaker.success()
+    return result
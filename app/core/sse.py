@@ -0,0 +1,124 @@
+import asyncio
+import re
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.http import HttpRequest
+from django.http.cookie import parse_cookie
+
+from account.models import Contact
+from .events import ALL_ACTIONS_CHANNEL, get_hub, image_channel, user_channel
+
+# Server-Sent Events streams, served by a plain ASGI app next to Django:
+# Django 4.1 can't stream a response asynchronously, and a thread per open
+# stream wouldn't scale. An idle stream costs a queue and a pending task.
+
+IMAGE_PATH = re.compile(r'^/events/images/(?P<id>\d+)/$')
+DASHBOARD_PATH = '/events/dashboard/'
+PING = b': ping\n\n'
+
+# open streams of this process, capped at SSE_MAX_STREAMS
+open_streams = 0
+
+
+def is_event_stream(scope):
+    return scope['type'] == 'http' and scope['path'].startswith('/events/')
+
+
+@sync_to_async
+def load_user(scope):
+    # the session cookie, as SessionMiddleware and AuthenticationMiddleware
+    # would read it
+    headers = dict(scope['headers'])
+    cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin-1'))
+    request = HttpRequest()
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(cookies.get(settings.SESSION_COOKIE_NAME))
+    return auth.get_user(request)
+
+
+@sync_to_async
+def dashboard_channels(user):
+    # the dashboard shows the actions of followed users, or everyone's
+    # when the user follows nobody
+    followed = Contact.objects.filter(user_from=user).values_list('user_to_id', flat=True)
+    channels = [user_channel(user_id) for user_id in followed[:settings.SSE_MAX_FOLLOWED]]
+    return channels or [ALL_ACTIONS_CHANNEL]
+
+
+async def respond(send, status, headers=()):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain'), *headers]})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream(receive, send, channels):
+    global open_streams
+    queue = asyncio.Queue(maxsize=settings.SSE_QUEUE_SIZE)
+    hub = get_hub()
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream'),
+        (b'cache-control', b'no-cache'),
+        # don't let nginx buffer the events
+        (b'x-accel-buffering', b'no'),
+    ]})
+    await send({'type': 'http.response.body', 'body': f'retry: {settings.SSE_RETRY}\n\n'.encode(),
+                'more_body': True})
+    open_streams += 1
+    await hub.subscribe(channels, queue)
+    disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+    get = None
+    try:
+        while True:
+            if get is None:
+                get = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({get, disconnect}, timeout=settings.SSE_HEARTBEAT,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnect in done:
+                break
+            if get in done:
+                body, get = get.result(), None
+            else:
+                # keeps proxies from closing an idle connection
+                body = PING
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    except OSError:
+        # the client went away while sending
+        pass
+    finally:
+        open_streams -= 1
+        disconnect.cancel()
+        if get is not None:
+            get.cancel()
+        await hub.unsubscribe(channels, queue)
+
+
+async def application(scope, receive, send):
+    """
+    ASGI app of the event streams: like counts of an image at
+    /events/images/<id>/, new actions for the dashboard at
+    /events/dashboard/.
+    """
+    match = IMAGE_PATH.match(scope['path'])
+    if not match and scope['path'] != DASHBOARD_PATH:
+        return await respond(send, 404)
+    if scope['method'] != 'GET':
+        return await respond(send, 405, [(b'allow', b'GET')])
+    if open_streams >= settings.SSE_MAX_STREAMS:
+        # the browser tries again after the retry delay
+        return await respond(send, 503, [(b'retry-after', b'10')])
+    if match:
+        channels = [image_channel(int(match['id']))]
+    else:
+        user = await load_user(scope)
+        if not user.is_authenticated:
+            return await respond(send, 403)
+        channels = await dashboard_channels(user)
+    await stream(receive, send, channels)
@@ -0,0 +1,48 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.utils.deconstruct import deconstructible
+
+# <prefix>/<ab>/<cd>/<file name>
+SHARDED_NAME = re.compile(r'^[^/]+/[0-9a-f]{2}/[0-9a-f]{2}/[^/]+$')
+
+
+def sharded_name(prefix, filename):
+    """
+    Storage name of a file under prefix, in one of 65536 random directories.
+    Date based directories put every upload of a busy day in the same
+    place, these stay small.
+    """
+    digest = uuid.uuid4().hex
+    return f'{prefix}/{digest[:2]}/{digest[2:4]}/{os.path.basename(filename)}'
+
+
+def moved_name(prefix, name):
+    """
+    Sharded name for a file moved from name. Derived from the old name, so
+    an interrupted move can resume, and prefixed with more of its hash, so
+    files of the same name from different directories don't meet.
+    """
+    digest = hashlib.md5(name.encode()).hexdigest()
+    return f'{prefix}/{digest[:2]}/{digest[2:4]}/{digest[4:12]}_{os.path.basename(name)}'
+
+
+def is_sharded(name):
+    return bool(SHARDED_NAME.match(name))
+
+
+@deconstructible
+class ShardedUploadTo:
+    """
+    upload_to callable storing the uploads of a field in sharded directories.
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def __call__(self, instance, filename):
+        return sharded_name(self.prefix, filename)
+
+    def __eq__(self, other):
+        return isinstance(other, ShardedUploadTo) and self.prefix == other.prefix
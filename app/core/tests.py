@@ -1,3 +1,306 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image as PILImage
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from fakeredis import TcpFakeServer
+from redis import asyncio as aioredis
+
+from images.models import Image
+from images.variants import generate_variants
+from . import ratelimit, redis_client
+from .storage import is_sharded, moved_name
+
+
+class RedisServerMixin:
+    """
+    Points the Redis clients at a fakeredis server, emptied before each test.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.redis_server = TcpFakeServer(('127.0.0.1', 0))
+        threading.Thread(target=cls.redis_server.serve_forever, daemon=True).start()
+        host, port = cls.redis_server.server_address
+        cls.redis_settings = override_settings(REDIS_URL=f'redis://{host}:{port}/0')
+        cls.redis_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        redis_client.reset()
+        cls.redis_settings.disable()
+        cls.redis_server.shutdown()
+        cls.redis_server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        # new clients and a closed circuit
+        redis_client.reset()
+        redis_client.get_redis().flushall()
+
+
+class RedisClientTests(RedisServerMixin, SimpleTestCase):
+    def count_connections(self):
+        counted = []
+        on_connect = aioredis.Connection.on_connect
+
+        async def counting(connection):
+            counted.append(connection)
+            await on_connect(connection)
+
+        patch = mock.patch.object(aioredis.Connection, 'on_connect', counting)
+        patch.start()
+        self.addCleanup(patch.stop)
+        return counted
+
+    @override_settings(SERVER_MODE='wsgi')
+    def test_wsgi_requests_share_connections(self):
+        connections = self.count_connections()
+        # every request of a WSGI worker runs its async view in a new loop
+        for i in range(5):
+            self.assertTrue(async_to_sync(redis_client.acall)(lambda r: r.incr('hits')))
+        self.assertEqual(redis_client.get_redis().get('hits'), b'5')
+        self.assertEqual(len(connections), 1)
+
+    def test_unavailable_opens_the_circuit(self):
+        with override_settings(REDIS_URL='redis://127.0.0.1:1/0'), \
+                self.assertLogs('core.redis_client', 'WARNING'):
+            redis_client.reset()
+            for i in range(redis_client.breaker.threshold):
+                self.assertEqual(redis_client.call(lambda r: r.ping(), default='down'), 'down')
+        self.assertTrue(redis_client.breaker.is_open)
+        # skipped without trying while the circuit is open
+        calls = []
+        self.assertIsNone(redis_client.call(calls.append))
+        self.assertEqual(calls, [])
+
+    def test_command_error_keeps_the_circuit_closed(self):
+        redis_client.get_redis().set('name', 'ann')
+        with self.assertLogs('core.redis_client', 'ERROR'):
+            for i in range(redis_client.breaker.threshold):
+                self.assertIsNone(redis_client.call(lambda r: r.incr('name')))
+        self.assertFalse(redis_client.breaker.is_open)
+
+
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMITS={'test': {'rate': '1/m', 'burst': 2}})
+class RateLimitTests(RedisServerMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        # the fake server drops the connection after the NOSCRIPT reply
+        # that makes the clients load the script, Redis doesn't
+        redis_client.get_redis().script_load(ratelimit.BUCKET_SCRIPT)
+
+    def take(self, now, capacity=2, rate=1):
+        wait = ratelimit.bucket_script(['bucket', ratelimit.STATS_KEY], [capacity, rate, now, 'test'],
+                                       client=redis_client.get_redis())
+        return float(wait)
+
+    def test_bucket_refill(self):
+        self.assertEqual([self.take(1000), self.take(1000), self.take(1000)], [0, 0, 1])
+        # half a token refilled
+        self.assertEqual(self.take(1000.5), 0.5)
+        self.assertEqual(self.take(1001), 0)
+        # never more than the capacity
+        self.assertEqual([self.take(1100), self.take(1100), self.take(1100)], [0, 0, 1])
+        self.assertEqual(ratelimit.decision_counts(), {('test', 'allowed'): 5, ('test', 'limited'): 3})
+
+    def post(self, view, **headers):
+        request = RequestFactory().post('/', REMOTE_ADDR='10.0.0.1', **headers)
+        request.user = mock.Mock(is_authenticated=False)
+        return view(request)
+
+    def check_limited(self, view):
+        self.assertEqual([self.post(view).status_code for i in range(3)], [200, 200, 429])
+        response = self.post(view)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        response = self.post(view, HTTP_ACCEPT='text/html')
+        self.assertContains(response, 'try again in 60 seconds', status_code=429)
+
+    def test_view(self):
+        self.check_limited(ratelimit.rate_limit('test')(lambda request: HttpResponse()))
+        # GET requests are not limited
+        request = RequestFactory().get('/')
+        self.assertEqual(ratelimit.rate_limit('test')(lambda request: HttpResponse())(request).status_code, 200)
+
+    def test_async_view(self):
+        async def view(request):
+            return HttpResponse()
+
+        self.check_limited(async_to_sync(ratelimit.rate_limit('test')(view)))
+
+    @override_settings(RATE_LIMIT_TRUSTED_PROXIES=['127.0.0.1', '10.1.0.0/16'])
+    def test_client_ip(self):
+        def client_ip(remote_addr, forwarded=None):
+            headers = {'HTTP_X_FORWARDED_FOR': forwarded} if forwarded else {}
+            return ratelimit.client_ip(RequestFactory().get('/', REMOTE_ADDR=remote_addr, **headers))
+
+        self.assertEqual(client_ip('203.0.113.5'), '203.0.113.5')
+        # only trusted proxies are believed
+        self.assertEqual(client_ip('203.0.113.5', '198.51.100.7'), '203.0.113.5')
+        self.assertEqual(client_ip('127.0.0.1', '198.51.100.7'), '198.51.100.7')
+        # through two proxies, after a forged entry
+        self.assertEqual(client_ip('127.0.0.1', '1.2.3.4, 198.51.100.7, 10.1.2.3'), '198.51.100.7')
+        self.assertEqual(client_ip('127.0.0.1'), '127.0.0.1')
+
+    @override_settings(RATE_LIMIT_TRUSTED_PROXIES=['127.0.0.1'])
+    def test_clients_behind_a_proxy_get_their_own_bucket(self):
+        view = ratelimit.rate_limit('test')(lambda request: HttpResponse())
+
+        def post(forwarded):
+            request = RequestFactory().post('/', REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR=forwarded)
+            request.user = mock.Mock(is_authenticated=False)
+            return view(request).status_code
+
+        self.assertEqual([post('198.51.100.7') for i in range(3)], [200, 200, 429])
+        self.assertEqual(post('198.51.100.8'), 200)
+
+    def test_requests_pass_while_redis_is_unavailable(self):
+        view = ratelimit.rate_limit('test')(lambda request: HttpResponse())
+        with override_settings(REDIS_URL='redis://127.0.0.1:1/0'), \
+                self.assertLogs('core.redis_client', 'WARNING'):
+            redis_client.reset()
+            self.assertEqual([self.post(view).status_code for i in range(3)], [200, 200, 200])
+
+
+class ShardMediaTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user('ann')
+
+    def add_image(self, name, color):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        PILImage.new('RGB', (40, 30), color).save(path)
+        image = Image.objects.create(user=self.user, title='Picture', url='https://example.com/a.jpg',
+                                     image=name)
+        generate_variants(image)
+        return image
+
+    def color(self, image):
+        with image.image.open('rb') as f:
+            return PILImage.open(f).convert('RGB').getpixel((0, 0))
+
+    def shard(self):
+        call_command('shard_media', stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_same_file_names_from_different_days(self):
+        red = self.add_image('images/2024/02/26/image.jpg', 'red')
+        blue = self.add_image('images/2024/11/15/image.jpg', 'blue')
+        self.shard()
+        red.refresh_from_db()
+        blue.refresh_from_db()
+        self.assertTrue(is_sharded(red.image.name))
+        self.assertNotEqual(red.image.name, blue.image.name)
+        self.assertGreater(self.color(red)[0], 200)
+        self.assertGreater(self.color(blue)[2], 200)
+        for image in (red, blue):
+            self.assertTrue(image.variants)
+            for variants in image.variants.values():
+                for width, name in variants:
+                    self.assertTrue(is_sharded(name))
+                    self.assertTrue(image.image.storage.exists(name))
+
+    def test_existing_file_is_not_overwritten(self):
+        image = self.add_image('images/2024/02/26/image.jpg', 'red')
+        target = moved_name('images', image.image.name)
+        os.makedirs(os.path.dirname(os.path.join(self.media, target)))
+        with open(os.path.join(self.media, target), 'wb') as f:
+            f.write(b'other')
+        self.shard()
+        image.refresh_from_db()
+        self.assertNotEqual(image.image.name, target)
+        self.assertGreater(self.color(image)[0], 200)
+        with open(os.path.join(self.media, target), 'rb') as f:
+            self.assertEqual(f.read(), b'other')
+
+    def test_second_run_moves_nothing(self):
+        image = self.add_image('images/2024/02/26/image.jpg', 'red')
+        self.shard()
+        image.refresh_from_db()
+        name = image.image.name
+        self.shard()
+        image.refresh_from_db()
+        self.assertEqual(image.image.name, name)
+        self.assertGreater(self.color(image)[0], 200)
+
+
+class SeedDataTests(RedisServerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        media_root = override_settings(MEDIA_ROOT=media)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def seed(self, **options):
+        call_command('seed_data', users=5, images=20, files=2, stdout=io.StringIO(), **options)
+
+    def test_views_match_the_counters(self):
+        self.seed()
+        r = redis_client.get_redis()
+        views = dict(Image.objects.values_list('id', 'views'))
+        self.assertEqual(len(views), 20)
+        self.assertGreater(sum(views.values()), 0)
+        counters = r.mget([f'image:{id}:views' for id in views])
+        self.assertEqual([int(value) for value in counters], list(views.values()))
+        self.assertEqual({int(id): int(score) for id, score in r.zrange('image_ranking', 0, -1, withscores=True)},
+                         views)
+
+    def test_without_redis(self):
+        self.seed(no_redis=True)
+        self.assertGreater(sum(Image.objects.values_list('views', flat=True)), 0)
+        self.assertEqual(redis_client.get_redis().dbsize(), 0)
+
+
+class BenchmarkTests(TransactionTestCase):
+    def benchmark(self, **options):
+        output = os.path.join(self.directory, 'report.json')
+        # each run seeds the same dataset again
+        call_command('flush', interactive=False, verbosity=0)
+        call_command('benchmark', users=5, images=20, requests=1, warmup=0, output=output,
+                     views=['image_detail', 'image_like', 'user_follow'],
+                     stdout=io.StringIO(), stderr=io.StringIO(), **options)
+        with open(output) as f:
+            return json.load(f)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_report_and_compare(self):
+        report = self.benchmark()
+        self.assertEqual(report['meta']['requests'], 1)
+        self.assertEqual(set(report['views']), {'image_detail', 'image_like', 'user_follow'})
+        for result in report['views'].values():
+            self.assertEqual(set(result), {'p50_ms', 'p90_ms', 'p99_ms', 'mean_ms',
+                                           'queries', 'redis_calls', 'redis_connections'})
+            self.assertGreater(result['queries'], 0)
+            # latency is left out, a single request is too noisy to compare
+            result['p50_ms'] = result['p90_ms'] = 1e6
+        baseline = os.path.join(self.directory, 'baseline.json')
+        with open(baseline, 'w') as f:
+            json.dump(report, f)
+        self.benchmark(compare=baseline)
+
+        report['views']['image_detail']['queries'] -= 1
+        report['views']['image_like']['redis_connections'] -= 1
+        with open(baseline, 'w') as f:
+            json.dump(report, f)
+        with self.assertRaisesMessage(CommandError, '2 regression(s) found.'):
+            self.benchmark(compare=baseline)
@@ -2,5 +2,8 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
-    path("", views.landing_page, name="landing_page")
+    path("", views.landing_page, name="landing_page"),
+    path("metrics/ratelimit/", views.rate_limit_metrics, name="rate_limit_metrics"),
+    path("events/images/<int:id>/", views.events_unavailable, name="image_events"),
+    path("events/dashboard/", views.events_unavailable, name="dashboard_events"),
 ]
\ No newline at end of file
@@ -1,8 +1,83 @@
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
+from .ratelimit import decision_counts
 
 
 def landing_page(request):
     '''
     Rendering the landing page
     '''
-    return render(request, 'core/landing_page.html')
\ No newline at end of file
+    return render(request, 'core/landing_page.html')
+
+def media(request, path):
+    '''
+    Serve a file from MEDIA_ROOT. Django only decides whether the file may be
+    sent and how long it can be cached, with MEDIA_SERVE_MODE set to x-accel
+    or x-sendfile the front proxy transfers the bytes.
+    '''
+    if settings.MEDIA_REQUIRE_LOGIN and not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Media file not found.')
+    if not os.path.isfile(full_path):
+        raise Http404('Media file not found.')
+
+    mode = settings.MEDIA_SERVE_MODE
+    if mode == 'x-accel':
+        response = HttpResponse()
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+    elif mode == 'x-sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = full_path
+    else:
+        # handles If-Modified-Since itself
+        response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if mode in ('x-accel', 'x-sendfile'):
+        # the proxy sends the body, it keeps the headers set here
+        content_type, encoding = mimetypes.guess_type(full_path)
+        response['Content-Type'] = content_type or 'application/octet-stream'
+    if settings.MEDIA_REQUIRE_LOGIN:
+        patch_cache_control(response, private=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+    return response
+
+
+def events_unavailable(request, **kwargs):
+    '''
+    Event streams are served by the ASGI app only (see core/sse.py), a 204
+    tells EventSource under WSGI not to reconnect.
+    '''
+    return HttpResponse(status=204)
+
+
+def rate_limit_metrics(request):
+    '''
+    Rate limiter decisions in the Prometheus text format, for staff users or
+    with the METRICS_TOKEN bearer token.
+    '''
+    token = settings.METRICS_TOKEN
+    if not (request.user.is_staff or
+            (token and request.headers.get('Authorization') == f'Bearer {token}')):
+        return HttpResponse(status=403)
+    lines = ['# HELP ratelimit_requests_total Rate limiter decisions by endpoint.',
+             '# TYPE ratelimit_requests_total counter']
+    for (name, decision), count in sorted(decision_counts().items()):
+        lines.append(f'ratelimit_requests_total{{endpoint="{name}",decision="{decision}"}} {count}')
+    lines += ['# HELP ratelimit_burst Bucket size by endpoint.',
+              '# TYPE ratelimit_burst gauge']
+    lines += [f'ratelimit_burst{{endpoint="{name}"}} {limit["burst"]}'
+              for name, limit in sorted(settings.RATE_LIMITS.items())]
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4')
@@ -0,0 +1,21 @@
+import os
+
+# SERVER_MODE=asgi runs the app under uvicorn workers, so the async views
+# can serve many concurrent Redis-bound requests per worker. The default
+# keeps the classic sync workers.
+server_mode = os.getenv('SERVER_MODE', 'wsgi')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', 3))
+
+if server_mode == 'asgi':
+    wsgi_app = 'bookmarks.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'bookmarks.wsgi:application'
+
+
+def post_worker_init(worker):
+    # load the duplicate image index before the first bookmark needs it
+    from images import dedup
+    dedup.hash_index.warm()
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ImagesConfig(AppConfig):
@@ -8,3 +9,5 @@ class ImagesConfig(AppConfig):
     def ready(self):
         # import signal handlers
         import images.signals
+        from .search import ensure_index
+        post_migrate.connect(ensure_index, sender=self)
@@ -0,0 +1,63 @@
+import gzip
+import hashlib
+import json
+import re
+
+import brotli
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+SOURCES = {'js': 'js/bookmarklet.js', 'css': 'css/bookmarklet.css'}
+
+# the bundle finds the site from its own URL, so it works on any host
+PRELUDE = '''(function(){
+var siteUrl = new URL('/', document.currentScript.src).href;
+var bookmarkletCss = %s;
+'''
+EPILOGUE = '\n})();\n'
+
+_bundle = None
+
+
+def minify_js(source):
+    # drop indentation, blank lines and whole line comments, keep line
+    # breaks so automatic semicolon insertion still works
+    lines = (line.strip() for line in source.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+def minify_css(source):
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    return re.sub(r'\s*([{}:;,>])\s*', r'\1', source).strip()
+
+
+def read_source(path):
+    with open(finders.find(path), encoding='utf-8') as f:
+        return f.read()
+
+
+def build_bundle():
+    """
+    Minify the bookmarklet script and stylesheet into a single script and
+    precompress it. The version is a hash of the content, so the bundle
+    URL changes only when the sources do.
+    """
+    css = minify_css(read_source(SOURCES['css']))
+    js = PRELUDE % json.dumps(css) + minify_js(read_source(SOURCES['js'])) + EPILOGUE
+    content = js.encode()
+    bundle = {
+        'version': hashlib.sha256(content).hexdigest()[:16],
+        'identity': content,
+        'gzip': gzip.compress(content, compresslevel=9, mtime=0),
+        'br': brotli.compress(content, mode=brotli.MODE_TEXT, quality=11),
+    }
+    return bundle
+
+
+def get_bundle():
+    global _bundle
+    # built once per process, rebuilt on every call while developing
+    if _bundle is None or settings.DEBUG:
+        _bundle = build_bundle()
+    return _bundle
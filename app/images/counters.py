@@ -0,0 +1,167 @@
+import os
+import threading
+from collections import Counter
+
+from core import redis_client
+from . import recommendations
+from .models import Image
+
+RANKING_KEY = 'image_ranking'
+
+
+def views_key(image_id):
+    return f'image:{image_id}:views'
+
+
+class ViewBuffer:
+    """
+    Views counted while Redis is unavailable, sent with the next call that
+    gets through.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, counts):
+        with self._lock:
+            self.counts.update(counts)
+
+    def drain(self):
+        with self._lock:
+            counts, self.counts = self.counts, Counter()
+        return counts
+
+
+view_buffer = ViewBuffer()
+# the last ranking read from Redis, served while it is unavailable
+_ranking = []
+
+
+def _reset():
+    # the parent's pending views are its own to send
+    global view_buffer
+    view_buffer = ViewBuffer()
+
+
+os.register_at_fork(after_in_child=_reset)
+
+
+def add_views(pipe, counts):
+    for image_id, count in counts.items():
+        pipe.incrby(views_key(image_id), count)
+        pipe.zincrby(RANKING_KEY, count, image_id)
+
+
+async def record_view(image_id):
+    """
+    Count a view of the image and read its "also liked" neighbours in one
+    round trip. While Redis is unavailable the view is buffered and
+    (None, []) is returned.
+    """
+    pending = view_buffer.drain()
+
+    async def run(r):
+        async with r.pipeline(transaction=False) as pipe:
+            add_views(pipe, pending)
+            pipe.incr(views_key(image_id))
+            pipe.zincrby(RANKING_KEY, 1, image_id)
+            pipe.zrevrange(recommendations.also_liked_key(image_id), 0, recommendations.SHOWN - 1)
+            results = await pipe.execute()
+        return results[-3], results[-1]
+
+    result = await redis_client.acall(run)
+    if result is None:
+        pending[image_id] += 1
+        view_buffer.add(pending)
+        return None, []
+    total_views, also_liked_ids = result
+    return total_views, [int(id) for id in also_liked_ids]
+
+
+async def top_ranked(count=10):
+    """
+    Ids of the most viewed images, from the last known ranking while Redis
+    is unavailable.
+    """
+    global _ranking
+    ids = await redis_client.acall(lambda r: r.zrange(RANKING_KEY, 0, count - 1, desc=True))
+    if ids is None:
+        if _ranking:
+            return _ranking[:count]
+        # nothing read yet in this process, use the last snapshot
+        return [id async for id in Image.objects.order_by('-views').values_list('id', flat=True)[:count]]
+    _ranking = [int(id) for id in ids]
+    return _ranking
+
+
+def save_views(r, keys):
+    counts = {}
+    for key, value in zip(keys, r.mget(keys)):
+        if value is not None:
+            counts[int(key.split(b':')[1])] = int(value)
+    images = Image.objects.filter(id__in=counts).only('id', 'views')
+    # counters only grow, a lower one means Redis lost it and the
+    # persisted count is kept until restore_views puts it back
+    changed = [image for image in images if counts[image.id] > image.views]
+    for image in changed:
+        image.views = counts[image.id]
+    Image.objects.bulk_update(changed, ['views'])
+    return len(changed)
+
+
+def snapshot_views(batch_size=1000, progress=None):
+    """
+    Copy the view counters from Redis to Image.views. The keys are SCANned
+    in batches, each read with one MGET and saved with one bulk_update.
+    Returns the number of images updated.
+    """
+    r = redis_client.get_job_redis()
+    done = 0
+    keys = []
+    for key in r.scan_iter(match=views_key('*'), count=batch_size):
+        keys.append(key)
+        if len(keys) == batch_size:
+            done += save_views(r, keys)
+            keys = []
+            if progress:
+                progress(done)
+    if keys:
+        done += save_views(r, keys)
+    return done
+
+
+def restore_batch(r, rows):
+    current = r.mget([views_key(image_id) for image_id, views in rows])
+    with r.pipeline(transaction=False) as pipe:
+        for (image_id, views), value in zip(rows, current):
+            missing = views - int(value or 0)
+            if missing > 0:
+                # add the difference rather than set, so views counted
+                # since the MGET are kept
+                pipe.incrby(views_key(image_id), missing)
+            pipe.zadd(RANKING_KEY, {image_id: views}, gt=True)
+        pipe.execute()
+
+
+def restore_views(batch_size=1000, progress=None):
+    """
+    Put the persisted view counts back into Redis after it lost them.
+    Counters that are ahead of the snapshot are left alone.
+    """
+    r = redis_client.get_job_redis()
+    rows = Image.objects.filter(views__gt=0).order_by('id').values_list('id', 'views')
+    done = 0
+    batch = []
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) == batch_size:
+            restore_batch(r, batch)
+            done += len(batch)
+            batch = []
+            if progress:
+                progress(done)
+    if batch:
+        restore_batch(r, batch)
+        done += len(batch)
+    return done
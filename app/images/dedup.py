@@ -0,0 +1,274 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from array import array
+from collections import deque
+from itertools import combinations
+
+from PIL import Image as PILImage
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Q
+
+from .models import Image
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+# bits of the chunks the hashes are indexed by: about log2 of the number of
+# images, so the buckets hold a handful of hashes each
+CHUNK_BITS = (21, 21, 22)
+CHUNKS = len(CHUNK_BITS)
+MASK = (1 << HASH_BITS) - 1
+# flat or nearly flat pictures hash to almost all 0 or all 1 bits and
+# would all match each other, they are only matched by their content
+MIN_DETAIL_BITS = 8
+# seconds after which an image id is assumed committed, if a later one was
+# already visible
+REFRESH_OVERLAP = 60
+# seconds between two reads of the images saved by other processes
+REFRESH_INTERVAL = 10
+
+
+def dhash(fp):
+    """
+    64-bit difference hash of an image file: whether each pixel of a 9x8
+    grayscale thumbnail is brighter than its right neighbour. Resized or
+    recompressed copies of a picture get the same or a very close hash.
+    Returned as a signed integer so it fits a BigIntegerField.
+    """
+    image = PILImage.open(fp)
+    # let the JPEG decoder downscale while decoding, much faster than a full decode
+    image.draft('L', (64, 64))
+    pixels = list(image.convert('L').resize((9, 8), PILImage.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            value = value << 1 | (left > pixels[row * 9 + col + 1])
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def checksum(fp):
+    # SHA-256 of the file content, equal only for identical files
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fp.read(64 * 1024), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def has_detail(value):
+    bits = bin(value & MASK).count('1')
+    return MIN_DETAIL_BITS <= bits <= HASH_BITS - MIN_DETAIL_BITS
+
+
+def hamming(a, b):
+    return bin((a ^ b) & MASK).count('1')
+
+
+def chunk_values(value):
+    value &= MASK
+    chunks = []
+    for bits in CHUNK_BITS:
+        chunks.append(value & ((1 << bits) - 1))
+        value >>= bits
+    return chunks
+
+
+_flips = {}
+
+
+def flip_masks(bits, radius):
+    # every bits wide mask with at most radius bits set
+    if (bits, radius) not in _flips:
+        masks = [0]
+        for count in range(1, radius + 1):
+            for positions in combinations(range(bits), count):
+                masks.append(sum(1 << p for p in positions))
+        _flips[bits, radius] = masks
+    return _flips[bits, radius]
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing: the 64-bit hashes are split in 3 chunks of 21 or
+    22 bits and indexed in one table per chunk. Two hashes within distance
+    d share at least one chunk within distance d // 3, so a lookup only
+    probes the buckets around each chunk of the query and checks the
+    candidates found there, instead of scanning every stored hash. Up to
+    distance 5 those are the exact buckets and their 21 neighbours; from
+    distance 6 on each chunk needs over 200 probes, about ten times slower.
+    """
+    def __init__(self):
+        # chunk value -> array of interleaved (id, hash) pairs
+        self.tables = [{} for _ in range(CHUNKS)]
+        self.size = 0
+
+    def add(self, id, value):
+        for table, chunk in zip(self.tables, chunk_values(value)):
+            bucket = table.get(chunk)
+            if bucket is None:
+                bucket = table[chunk] = array('q')
+            bucket.extend((id, value))
+        self.size += 1
+
+    def contains(self, id, value):
+        bucket = self.tables[0].get(chunk_values(value)[0])
+        return bool(bucket) and id in bucket[::2]
+
+    def query(self, value, max_distance):
+        """
+        Return (distance, id) pairs of the stored hashes within max_distance
+        bits of value, closest first.
+        """
+        radius = max_distance // CHUNKS
+        candidates = {}
+        for table, bits, chunk in zip(self.tables, CHUNK_BITS, chunk_values(value)):
+            for mask in flip_masks(bits, radius):
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    candidates.update(zip(bucket[::2], bucket[1::2]))
+        matches = []
+        for id, other in candidates.items():
+            distance = bin((value ^ other) & MASK).count('1')
+            if distance <= max_distance:
+                matches.append((distance, id))
+        matches.sort()
+        return matches
+
+
+class ImageHashIndex:
+    """
+    Process wide index of the hashes of original images (not flagged as a
+    duplicate), so lookups never wait on the database. A background thread
+    loads it, then reads the images saved by other processes every
+    REFRESH_INTERVAL seconds; lookups made before it is loaded only find
+    exact matches in the database. Images saved by this process are added
+    right away.
+    """
+    def __init__(self):
+        self.index = MultiIndexHash()
+        # every image up to this id is in the index
+        self.settled = 0
+        # (time, highest id loaded) of the recent refreshes
+        self.checkpoints = deque()
+        self.ready = False
+        self.loader = None
+        self.lock = threading.Lock()
+        self.loader_lock = threading.Lock()
+
+    def warm(self):
+        with self.loader_lock:
+            if self.loader is None:
+                self.loader = threading.Thread(target=self.run, name='image-hash-index', daemon=True)
+                self.loader.start()
+
+    def run(self):
+        while True:
+            try:
+                self.load()
+            except DatabaseError:
+                logger.exception('Could not refresh the image hash index')
+            finally:
+                # the thread's own connection, not kept open in between
+                connection.close()
+            time.sleep(REFRESH_INTERVAL)
+
+    def load(self):
+        self.refresh()
+        self.ready = True
+
+    def refresh(self):
+        # ids are given out before commit, so a lower id can become visible
+        # after a higher one: the ids of the last REFRESH_OVERLAP seconds
+        # are read again, the ones already loaded skipped
+        rows = (Image.objects.filter(id__gt=self.settled, duplicate_of=None)
+                .exclude(phash=None).order_by('id').values_list('id', 'phash'))
+        highest = self.settled
+        batch = []
+        for id, phash in rows.iterator(chunk_size=10000):
+            batch.append((id, phash))
+            highest = id
+            if len(batch) == 10000:
+                self.add(batch)
+                batch = []
+        self.add(batch)
+        now = time.monotonic()
+        self.checkpoints.append((now, highest))
+        while now - self.checkpoints[0][0] > REFRESH_OVERLAP:
+            self.settled = max(self.settled, self.checkpoints.popleft()[1])
+
+    def add(self, rows):
+        with self.lock:
+            for id, phash in rows:
+                if not self.index.contains(id, phash):
+                    self.index.add(id, phash)
+
+    def query(self, phash, max_distance):
+        if not self.ready:
+            self.warm()
+            ids = Image.objects.filter(phash=phash, duplicate_of=None).values_list('id', flat=True)
+            return [(0, id) for id in ids[:1]]
+        with self.lock:
+            return self.index.query(phash, max_distance)
+
+
+hash_index = ImageHashIndex()
+
+
+def _reset():
+    # the parent's loader thread doesn't exist in a forked child
+    global hash_index
+    hash_index = ImageHashIndex()
+
+
+os.register_at_fork(after_in_child=_reset)
+
+
+def add_originals(images):
+    # found right away by this process, by the others after their next refresh
+    hash_index.add([(image.id, image.phash) for image in images
+                    if image.phash is not None and image.duplicate_of_id is None])
+
+
+def find_original(phash):
+    """
+    Return the stored original image closest to the given hash within
+    IMAGE_DUPLICATE_DISTANCE bits, or None.
+    """
+    if phash is None or not has_detail(phash):
+        return None
+    matches = hash_index.query(phash, settings.IMAGE_DUPLICATE_DISTANCE)
+    if not matches:
+        return None
+    # deleted images stay in the index, skip them
+    images = Image.objects.in_bulk([id for distance, id in matches])
+    for distance, id in matches:
+        if id in images:
+            return images[id]
+    return None
+
+
+def find_copy(content_checksum):
+    """
+    Return a stored image with an identical file, or None. Only those share
+    their files: near duplicates may differ in what matters, e.g. two flat
+    pictures of different colours.
+    """
+    return (Image.objects.filter(checksum=content_checksum).select_related('duplicate_of')
+            .order_by('id').first())
+
+
+def share_files(image, copy):
+    # flagged as a duplicate of the copy's original, which may be a near one
+    image.duplicate_of = copy.duplicate_of or copy
+    image.image = copy.image.name
+    image.variants = copy.variants
+
+
+def user_copy(user, original):
+    # the user's own bookmark of the original or of one of its duplicates
+    return Image.objects.filter(user=user).filter(
+        Q(id=original.id) | Q(duplicate_of=original)).first()
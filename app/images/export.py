@@ -0,0 +1,107 @@
+import json
+import os
+import tempfile
+import zipfile
+
+from django.utils import timezone
+
+from .models import Image
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ZipStream:
+    """
+    Write only file object for ZipFile. Without seek() ZipFile writes the
+    archive sequentially, the generator sends what was written so far.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def archive_name(image):
+    extension = os.path.splitext(image.image.name)[1].lower() or '.jpg'
+    return f'images/{image.id}-{image.slug or "image"}{extension}'
+
+
+def manifest_entry(image, name):
+    return {
+        'id': image.id,
+        'title': image.title,
+        'description': image.description,
+        'url': image.url,
+        'created': image.created.isoformat(),
+        'likes': image.total_likes,
+        'views': image.views,
+        'file': name,
+    }
+
+
+def export_zip(user):
+    """
+    Yield a ZIP archive of the user's images with a manifest.json. Images
+    are read from the database and the storage piece by piece, the
+    manifest is spooled to a temporary file, so memory stays flat however
+    many images there are.
+    """
+    stream = ZipStream()
+    images = (Image.objects.filter(user=user).order_by('id')
+              .only('id', 'title', 'slug', 'description', 'url', 'created',
+                    'image', 'total_likes', 'views'))
+    with zipfile.ZipFile(stream, 'w') as archive, \
+            tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as manifest:
+        manifest.write(b'[\n')
+        first = True
+        for image in images.iterator(chunk_size=500):
+            name = archive_name(image)
+            try:
+                source = image.image.open('rb')
+            except (OSError, ValueError):
+                # missing file, only listed in the manifest
+                name = None
+            else:
+                info = zipfile.ZipInfo(name, image.created.timetuple()[:6])
+                # pictures are compressed already
+                info.compress_type = zipfile.ZIP_STORED
+                with source, archive.open(info, 'w') as dest:
+                    while True:
+                        chunk = source.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dest.write(chunk)
+                        yield stream.pop()
+            if not first:
+                manifest.write(b',\n')
+            first = False
+            manifest.write(json.dumps(manifest_entry(image, name)).encode())
+        manifest.write(b'\n]\n')
+        manifest.seek(0)
+        info = zipfile.ZipInfo('manifest.json', timezone.localtime().timetuple()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with archive.open(info, 'w') as dest:
+            while True:
+                chunk = manifest.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                dest.write(chunk)
+                yield stream.pop()
+    # the central directory, written on close
+    yield stream.pop()
@@ -1,9 +1,23 @@
 from django import forms
+from django.conf import settings
 from .models import Image
+from .dedup import checksum, dhash, find_copy, find_original, share_files
 from django.core.files.base import ContentFile
+from django.core.validators import URLValidator
 from django.utils.text import slugify
+import io
 import requests
 
+VALID_EXTENSIONS = ['jpg', 'jpeg', 'png']
+
+
+def validate_image_url(url):
+    URLValidator()(url)
+    extension = url.rsplit('.', 1)[-1].lower()
+    if extension not in VALID_EXTENSIONS:
+        raise forms.ValidationError('The given URL does not match valid image extensions.')
+
+
 class ImageCreateForm(forms.ModelForm):
     class Meta:
         model = Image
@@ -14,10 +28,7 @@ class ImageCreateForm(forms.ModelForm):
 
     def clean_url(self):
         url = self.cleaned_data['url']
-        valid_extensions = ['jpg', 'jpeg', 'png']
-        extension = url.rsplit('.', 1)[1].lower()
-        if extension not in valid_extensions:
-            raise forms.ValidationError('The given URL does not match valid image extensions.')
+        validate_image_url(url)
         return url
     
     def save(self, force_insert=False, force_update=False, commit=True):
@@ -28,8 +39,43 @@ class ImageCreateForm(forms.ModelForm):
         image_name = f'{name}.{extension}'
         #download image from the given URL
         response = requests.get(image_url)
-        image.image.save(image_name, ContentFile(response.content), save=False)
+        image.checksum = checksum(io.BytesIO(response.content))
+        try:
+            image.phash = dhash(io.BytesIO(response.content))
+        except OSError:
+            image.phash = None
+        copy = find_copy(image.checksum)
+        if copy:
+            # the very same file, share it
+            share_files(image, copy)
+        else:
+            # a near duplicate is only flagged, the user keeps their own
+            # file. Written when the image is saved
+            image.duplicate_of = find_original(image.phash)
+            image.image = ContentFile(response.content, name=image_name)
 
         if commit:
             image.save()
-        return image
\ No newline at end of file
+        return image
+
+
+class BookmarkImportForm(forms.Form):
+    file = forms.FileField(help_text='A bookmarks HTML export from your browser, '
+                                     'or a CSV or JSON file with url, title and '
+                                     'description fields.')
+
+    def clean_file(self):
+        from .importer import parse_bookmarks
+        upload = self.cleaned_data['file']
+        # checked before the file is read into memory
+        if upload.size > settings.IMPORT_MAX_FILE_SIZE:
+            raise forms.ValidationError(
+                f'The file is too large, the limit is {settings.IMPORT_MAX_FILE_SIZE // (1024 * 1024)} MB.')
+        entries = parse_bookmarks(upload.read(), upload.name)
+        if not entries:
+            raise forms.ValidationError('No bookmarks found in the file.')
+        if len(entries) > settings.IMPORT_MAX_BOOKMARKS:
+            raise forms.ValidationError(
+                f'You can import up to {settings.IMPORT_MAX_BOOKMARKS} bookmarks at once.')
+        self.entries = entries
+        return upload
\ No newline at end of file
@@ -0,0 +1,252 @@
+import csv
+import io
+import json
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from itertools import zip_longest
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from PIL import Image as PILImage
+from django import forms
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils.text import slugify
+
+from actions.utils import create_action
+from .dedup import MultiIndexHash, add_originals, checksum, dhash, find_copy, find_original, has_detail, share_files, user_copy
+from .forms import validate_image_url
+from .models import Image
+
+# keep at most this many failures in the import result
+MAX_REPORTED_FAILURES = 100
+MAX_REDIRECTS = 3
+
+
+class NetscapeBookmarkParser(HTMLParser):
+    """
+    Collect the links of a Netscape bookmark file, the format browsers use
+    to export bookmarks.
+    """
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+        self.current = None
+        self.target = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            attrs = dict(attrs)
+            self.current = {'url': attrs.get('href', ''), 'title': '', 'description': ''}
+            self.entries.append(self.current)
+            self.target = 'title'
+        elif tag == 'dd' and self.current:
+            self.target = 'description'
+        elif tag in ('dt', 'dl', 'h3'):
+            self.target = None
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self.target = None
+
+    def handle_data(self, data):
+        if self.target:
+            self.current[self.target] += data
+
+
+def parse_bookmarks(data, filename=''):
+    """
+    Parse a Netscape bookmarks HTML, CSV or JSON export into a list of
+    {'url', 'title', 'description'} dictionaries.
+    """
+    text = data.decode('utf-8-sig', errors='replace') if isinstance(data, bytes) else data
+    stripped = text.lstrip()
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension == 'json' or stripped[:1] in ('[', '{'):
+        try:
+            rows = json.loads(text)
+        except ValueError:
+            raise forms.ValidationError('The file is not valid JSON.')
+        if isinstance(rows, dict):
+            rows = rows.get('bookmarks', [])
+        if not isinstance(rows, list):
+            raise forms.ValidationError('Expected a list of bookmarks.')
+        rows = [row for row in rows if isinstance(row, dict)]
+    elif extension in ('html', 'htm') or stripped[:1] == '<':
+        parser = NetscapeBookmarkParser()
+        parser.feed(text)
+        rows = parser.entries
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames or 'url' not in [f.strip().lower() for f in reader.fieldnames]:
+            raise forms.ValidationError('The CSV file needs a "url" column.')
+        rows = [{(k or '').strip().lower(): v for k, v in row.items()} for row in reader]
+    return [{'url': str(row.get('url') or '').strip(),
+             'title': str(row.get('title') or '').strip(),
+             'description': str(row.get('description') or '').strip()}
+            for row in rows]
+
+
+class Downloader:
+    """
+    Download images from many threads while limiting the number of
+    concurrent requests sent to a single host.
+    """
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.host_limits = defaultdict(
+            lambda: threading.BoundedSemaphore(settings.IMPORT_MAX_PER_HOST))
+
+    def session(self):
+        # requests sessions are not thread safe, use one per thread
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def fetch(self, url):
+        # redirects are followed here rather than by requests, so every hop
+        # is validated and counted against the limit of its own host
+        for hop in range(MAX_REDIRECTS + 1):
+            content, location = self.fetch_once(url)
+            if location is None:
+                break
+            url = urljoin(url, location)
+            try:
+                validate_image_url(url)
+            except forms.ValidationError as e:
+                raise ValueError(f'Redirected to an invalid URL: {" ".join(e.messages)}')
+        else:
+            raise ValueError('Too many redirects.')
+        # make sure we got an image and not an error page
+        PILImage.open(io.BytesIO(content)).verify()
+        return content
+
+    def fetch_once(self, url):
+        with self.lock:
+            limit = self.host_limits[urlsplit(url).hostname]
+        with limit:
+            with self.session().get(url, timeout=settings.IMPORT_TIMEOUT, stream=True,
+                                    allow_redirects=False) as response:
+                if response.is_redirect:
+                    return None, response.headers['Location']
+                response.raise_for_status()
+                content = bytearray()
+                for chunk in response.iter_content(64 * 1024):
+                    content += chunk
+                    if len(content) > settings.IMPORT_MAX_IMAGE_SIZE:
+                        raise ValueError('The image is too large.')
+        return bytes(content), None
+
+    def fetch_or_error(self, url):
+        try:
+            return self.fetch(url), None
+        except (requests.RequestException, ValueError, OSError) as e:
+            return None, str(e) or e.__class__.__name__
+
+
+def interleave_hosts(entries):
+    # round-robin over hosts so the per-host limit doesn't stall the pool
+    by_host = defaultdict(list)
+    for entry in entries:
+        by_host[urlsplit(entry['url']).hostname].append(entry)
+    return [entry for group in zip_longest(*by_host.values()) for entry in group if entry]
+
+
+def import_bookmarks(user, entries, progress=None, chunk_size=200):
+    """
+    Validate, download and store the given bookmarks for the user. Calls
+    progress(done, total) after every chunk and returns a summary dict.
+    """
+    result = {'total': len(entries), 'created': 0, 'skipped': 0,
+              'failed_count': 0, 'failed': [], 'image_ids': []}
+
+    def fail(url, message):
+        result['failed_count'] += 1
+        if len(result['failed']) < MAX_REPORTED_FAILURES:
+            result['failed'].append({'url': url, 'error': message})
+
+    seen = set(Image.objects.filter(user=user).values_list('url', flat=True))
+    valid = []
+    for entry in entries:
+        url = entry['url']
+        if url in seen:
+            result['skipped'] += 1
+            continue
+        try:
+            validate_image_url(url)
+        except forms.ValidationError as e:
+            fail(url, ' '.join(e.messages))
+            continue
+        seen.add(url)
+        valid.append(entry)
+    done = len(entries) - len(valid)
+    if progress:
+        progress(done, len(entries))
+
+    downloader = Downloader()
+    with ThreadPoolExecutor(max_workers=settings.IMPORT_MAX_WORKERS) as executor:
+        for start in range(0, len(valid), chunk_size):
+            chunk = interleave_hosts(valid[start:start + chunk_size])
+            images = []
+            # hashes of this chunk, not in the database yet
+            pending = MultiIndexHash()
+            pending_checksums = set()
+            downloads = executor.map(downloader.fetch_or_error, [e['url'] for e in chunk])
+            for entry, (content, error) in zip(chunk, downloads):
+                if error:
+                    fail(entry['url'], error)
+                    continue
+                try:
+                    phash = dhash(io.BytesIO(content))
+                except OSError:
+                    phash = None
+                content_checksum = checksum(io.BytesIO(content))
+                copy = find_copy(content_checksum)
+                if copy:
+                    original = copy.duplicate_of or copy
+                else:
+                    original = find_original(phash)
+                if ((original and user_copy(user, original))
+                        or content_checksum in pending_checksums
+                        or (phash is not None and has_detail(phash)
+                            and pending.query(phash, settings.IMAGE_DUPLICATE_DISTANCE))):
+                    # a resized or recompressed copy of an image the user already has
+                    result['skipped'] += 1
+                    continue
+                title = entry['title'][:200] or entry['url'].rsplit('/', 1)[-1][:200]
+                image = Image(user=user, title=title, slug=slugify(title)[:200],
+                              url=entry['url'], description=entry['description'],
+                              phash=phash, checksum=content_checksum)
+                if copy:
+                    # the very same file, share it
+                    share_files(image, copy)
+                else:
+                    # a near duplicate is only flagged, the user keeps their own file
+                    image.duplicate_of = original
+                    extension = entry['url'].rsplit('.', 1)[-1].lower()
+                    image.image.save(f'{image.slug or "image"}.{extension}',
+                                     ContentFile(content), save=False)
+                pending_checksums.add(content_checksum)
+                if phash is not None:
+                    pending.add(len(images), phash)
+                images.append(image)
+            Image.objects.bulk_create(images)
+            # bulk_create skips the post_save ingest signal
+            add_originals(images)
+            from .tasks import generate_variants_task  # tasks imports this module
+            for image in images:
+                if not image.variants:
+                    generate_variants_task.delay(image.id)
+            result['created'] += len(images)
+            result['image_ids'] += [image.id for image in images]
+            done += len(chunk)
+            if progress:
+                progress(done, len(entries))
+
+    if result['created']:
+        # one summary action instead of one per image
+        create_action(user, f'bookmarked {result["created"]} images')
+    return result
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from images.recommendations import compute_also_liked
+
+
+class Command(BaseCommand):
+    help = 'Recompute the "also liked" neighbours of every image from the likes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        def progress(done, total):
+            self.stdout.write(f'{done}/{total} images')
+
+        done = compute_also_liked(options['batch_size'], progress)
+        self.stdout.write(self.style.SUCCESS(f'Stored neighbours for {done} images.'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from images.models import Image
+from images.variants import generate_variants
+
+
+class Command(BaseCommand):
+    help = 'Generate the responsive variants of images that have none yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate the variants of every image.')
+
+    def handle(self, *args, **options):
+        images = Image.objects.exclude(image='').order_by('id')
+        if not options['all']:
+            images = images.filter(variants={})
+        done = failed = 0
+        for image in images.iterator(chunk_size=500):
+            try:
+                generate_variants(image)
+                done += 1
+            except OSError as e:
+                failed += 1
+                self.stderr.write(f'Image {image.id}: {e}')
+            if done and done % 500 == 0:
+                self.stdout.write(f'{done} images processed')
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {done} images, {failed} failed.'))
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from images.dedup import MultiIndexHash, checksum, dhash, has_detail
+from images.models import Image
+
+
+class Command(BaseCommand):
+    help = ('Compute the perceptual hash and checksum of images that have none yet and '
+            'optionally flag near duplicates.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flag-duplicates', action='store_true',
+                            help='Mark every image as a duplicate of the oldest near identical image.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        images = (Image.objects.filter(Q(phash=None) | Q(checksum='')).exclude(image='')
+                  .order_by('id').only('id', 'image'))
+        done = failed = 0
+        # page by id instead of keeping a cursor open over the rows being updated
+        last_id = 0
+        while True:
+            batch = list(images.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            hashed = []
+            for image in batch:
+                try:
+                    with image.image.open('rb') as f:
+                        image.checksum = checksum(f)
+                        f.seek(0)
+                        image.phash = dhash(f)
+                except OSError as e:
+                    failed += 1
+                    self.stderr.write(f'Image {image.id}: {e}')
+                    continue
+                hashed.append(image)
+            done += self.save(hashed, ['phash', 'checksum'])
+        self.stdout.write(self.style.SUCCESS(f'Hashed {done} images, {failed} failed.'))
+
+        if options['flag_duplicates']:
+            self.flag_duplicates(batch_size)
+
+    def save(self, batch, fields):
+        Image.objects.bulk_update(batch, fields)
+        count = len(batch)
+        batch.clear()
+        return count
+
+    def flag_duplicates(self, batch_size):
+        index = MultiIndexHash()
+        flagged = 0
+        rows = Image.objects.exclude(phash=None).order_by('id').values_list('id', 'phash', 'duplicate_of')
+        last_id = 0
+        while True:
+            page = list(rows.filter(id__gt=last_id)[:batch_size])
+            if not page:
+                break
+            last_id = page[-1][0]
+            batch = []
+            for id, phash, duplicate_of in page:
+                if not has_detail(phash):
+                    # only matched by their content, at ingest
+                    continue
+                matches = index.query(phash, settings.IMAGE_DUPLICATE_DISTANCE)
+                original = matches[0][1] if matches else None
+                if original is None:
+                    index.add(id, phash)
+                if original != duplicate_of:
+                    batch.append(Image(id=id, duplicate_of_id=original))
+            flagged += self.save(batch, ['duplicate_of'])
+        self.stdout.write(self.style.SUCCESS(f'Updated the duplicate flag of {flagged} images.'))
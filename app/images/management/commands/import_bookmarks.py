@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django import forms
+from images.importer import import_bookmarks, parse_bookmarks
+
+
+class Command(BaseCommand):
+    help = 'Import a bookmarks HTML, CSV or JSON file for a user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('file')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" does not exist.')
+        with open(options['file'], 'rb') as f:
+            try:
+                entries = parse_bookmarks(f.read(), options['file'])
+            except forms.ValidationError as e:
+                raise CommandError(' '.join(e.messages))
+
+        def progress(done, total):
+            self.stdout.write(f'{done}/{total} bookmarks processed')
+
+        result = import_bookmarks(user, entries, progress=progress)
+        for failure in result['failed']:
+            self.stderr.write(f'{failure["url"]}: {failure["error"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{result["created"]} imported, {result["skipped"]} already bookmarked, '
+            f'{result["failed_count"]} failed.'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from images.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Create the image full-text index if missing and rebuild it from the existing images.'
+
+    def handle(self, *args, **options):
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
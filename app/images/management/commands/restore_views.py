@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from images.counters import restore_views
+
+
+class Command(BaseCommand):
+    help = 'Restore the view counters and ranking in Redis from the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        def progress(done):
+            self.stdout.write(f'{done} images')
+
+        done = restore_views(options['batch_size'], progress)
+        self.stdout.write(self.style.SUCCESS(f'Restored the views of {done} images.'))
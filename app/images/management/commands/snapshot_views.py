@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from images.counters import snapshot_views
+
+
+class Command(BaseCommand):
+    help = 'Copy the view counters from Redis to the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        def progress(done):
+            self.stdout.write(f'{done} images updated')
+
+        done = snapshot_views(options['batch_size'], progress)
+        self.stdout.write(self.style.SUCCESS(f'Saved the views of {done} images.'))
@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# The statements are copied here rather than imported from images.search,
+# so later changes to the runtime code don't change this migration.
+
+SQLITE_SETUP = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS images_image_fts USING fts5(
+        title, description, content='images_image', content_rowid='id',
+        tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS images_image_fts_insert AFTER INSERT ON images_image BEGIN
+        INSERT INTO images_image_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS images_image_fts_delete AFTER DELETE ON images_image BEGIN
+        INSERT INTO images_image_fts(images_image_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS images_image_fts_update AFTER UPDATE ON images_image
+    WHEN old.title IS NOT new.title OR old.description IS NOT new.description BEGIN
+        INSERT INTO images_image_fts(images_image_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO images_image_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END""",
+    "INSERT INTO images_image_fts(images_image_fts) VALUES ('rebuild')",
+]
+
+SQLITE_TEARDOWN = [
+    'DROP TRIGGER IF EXISTS images_image_fts_insert',
+    'DROP TRIGGER IF EXISTS images_image_fts_delete',
+    'DROP TRIGGER IF EXISTS images_image_fts_update',
+    'DROP TABLE IF EXISTS images_image_fts',
+]
+
+POSTGRES_SETUP = [
+    """ALTER TABLE images_image ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED""",
+    'CREATE INDEX IF NOT EXISTS images_image_search_idx ON images_image USING GIN (search_vector)',
+]
+
+POSTGRES_TEARDOWN = [
+    'DROP INDEX IF EXISTS images_image_search_idx',
+    'ALTER TABLE images_image DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("images", "0004_image_variants"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_SETUP, 'postgresql': POSTGRES_SETUP}),
+            run({'sqlite': SQLITE_TEARDOWN, 'postgresql': POSTGRES_TEARDOWN}),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.13 on 2026-10-18 23:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("images", "0005_image_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="duplicate_of",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="duplicates",
+                to="images.image",
+            ),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="phash",
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
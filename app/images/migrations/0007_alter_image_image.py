@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 23:09
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("images", "0006_image_phash"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="image",
+            name="image",
+            field=models.ImageField(upload_to=core.storage.ShardedUploadTo("images")),
+        ),
+    ]
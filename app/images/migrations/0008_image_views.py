@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-18 23:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("images", "0007_alter_image_image"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="views",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="image",
+            index=models.Index(fields=["-views"], name="images_imag_views_bea102_idx"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-18 23:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("images", "0008_image_views"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="checksum",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
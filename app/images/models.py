@@ -2,6 +2,7 @@ from django.db import models
 from django.conf import settings
 from django.utils.text import slugify
 from django.urls import reverse
+from core.storage import ShardedUploadTo
 
 # Create your models here.
 class Image(models.Model):
@@ -9,11 +10,21 @@ class Image(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, blank=True)
     url = models.URLField(max_length=2000)
-    image = models.ImageField(upload_to='images/%Y/%m/%d')
+    image = models.ImageField(upload_to=ShardedUploadTo('images'))
     description = models.TextField(blank=True)
     created = models.DateField(auto_now_add=True)
     users_like = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='images_liked', blank=True)
     total_likes = models.PositiveIntegerField(default=0)
+    # view count as of the last snapshot, the live counter is in Redis
+    views = models.PositiveIntegerField(default=0)
+    # responsive variants by format, as [width, file name] pairs
+    variants = models.JSONField(default=dict, blank=True)
+    # perceptual hash of the picture, to spot resized or recompressed copies
+    phash = models.BigIntegerField(null=True, blank=True, db_index=True)
+    # SHA-256 of the file, only identical files are shared between images
+    checksum = models.CharField(max_length=64, blank=True, db_index=True)
+    duplicate_of = models.ForeignKey('self', related_name='duplicates', null=True, blank=True,
+                                     on_delete=models.SET_NULL)
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -23,10 +34,18 @@ class Image(models.Model):
     def get_absolute_url(self):
         return reverse('images:detail', args=[self.id, self.slug])
 
+    def get_full_size_url(self):
+        # largest progressive JPEG variant, or the original download
+        if self.variants.get('jpeg'):
+            width, name = self.variants['jpeg'][-1]
+            return self.image.storage.url(name)
+        return self.image.url
+
     class Meta:
         indexes = [
             models.Index(fields=['-created']),
             models.Index(fields=['-total_likes']),
+            models.Index(fields=['-views']),
         ]
         ordering = ['-created']
 
@@ -0,0 +1,96 @@
+import heapq
+from collections import Counter, defaultdict
+
+from core import redis_client
+from .models import Image
+
+# neighbours shown on the detail page
+SHOWN = 6
+# neighbours kept per image, the slack absorbs incremental updates
+KEEP = 50
+# only the most recent likes of a user count, heavy likers would
+# otherwise add a quadratic number of pairs
+MAX_USER_LIKES = 200
+
+def also_liked_key(image_id):
+    return f'image:{image_id}:also_liked'
+
+
+def recent_likes(user, exclude=None):
+    likes = Image.users_like.through.objects.filter(user=user)
+    if exclude:
+        likes = likes.exclude(image_id=exclude)
+    return list(likes.order_by('-id').values_list('image_id', flat=True)[:MAX_USER_LIKES])
+
+
+def record_like(user, image_id, delta=1):
+    """
+    Update the co-like counts between the image and the other images the
+    user likes, after the user liked (delta=1) or unliked (delta=-1) it.
+    Skipped while Redis is unavailable, the nightly job catches up.
+    """
+    others = recent_likes(user, exclude=image_id)
+    if others:
+        redis_client.call(lambda r: update_co_likes(r, image_id, others, delta))
+
+
+def update_co_likes(r, image_id, others, delta):
+    key = also_liked_key(image_id)
+    with r.pipeline(transaction=False) as pipe:
+        for other in others:
+            other_key = also_liked_key(other)
+            pipe.zincrby(key, delta, other)
+            pipe.zincrby(other_key, delta, image_id)
+            if delta > 0:
+                pipe.zremrangebyrank(other_key, 0, -KEEP - 1)
+            else:
+                pipe.zremrangebyscore(other_key, '-inf', 0)
+        if delta > 0:
+            pipe.zremrangebyrank(key, 0, -KEEP - 1)
+        else:
+            pipe.zremrangebyscore(key, '-inf', 0)
+        pipe.execute()
+
+
+def compute_also_liked(batch_size=500, progress=None):
+    """
+    Recompute the co-like neighbours of every liked image, i.e. the rows of
+    the item co-occurrence matrix A'A where A is the user x image like
+    matrix, and store the top KEEP of each row in Redis.
+    """
+    image_users = defaultdict(list)
+    user_images = defaultdict(list)
+    likes = Image.users_like.through.objects.order_by('-id').values_list('user_id', 'image_id')
+    for user_id, image_id in likes.iterator(chunk_size=10000):
+        if len(user_images[user_id]) < MAX_USER_LIKES:
+            user_images[user_id].append(image_id)
+            image_users[image_id].append(user_id)
+
+    r = redis_client.get_job_redis()
+    # drop the neighbours of images nobody likes any more
+    stale = [key for key in r.scan_iter(match=also_liked_key('*'), count=1000)
+             if int(key.split(b':')[1]) not in image_users]
+    for start in range(0, len(stale), batch_size):
+        r.delete(*stale[start:start + batch_size])
+
+    # a transaction per batch, so readers never see a key between delete and zadd
+    pipe = r.pipeline()
+    done = 0
+    for image_id, users in image_users.items():
+        # one row of A'A: sparse sum of the like vectors of its likers
+        counts = Counter()
+        for user_id in users:
+            counts.update(user_images[user_id])
+        del counts[image_id]
+        key = also_liked_key(image_id)
+        pipe.delete(key)
+        top = heapq.nlargest(KEEP, counts.items(), key=lambda item: item[1])
+        if top:
+            pipe.zadd(key, dict(top))
+        done += 1
+        if done % batch_size == 0:
+            pipe.execute()
+            if progress:
+                progress(done, len(image_users))
+    pipe.execute()
+    return done
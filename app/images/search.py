@@ -0,0 +1,182 @@
+import base64
+import json
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+from .models import Image
+
+# weight of the like count in the ranking, relative to the text relevance
+LIKES_BOOST = 0.5
+# likes needed to get half of the boost
+LIKES_HALF = 10.0
+
+FTS_TABLE = 'images_image_fts'
+GIN_INDEX = 'images_image_search_idx'
+
+SQLITE_SETUP = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description, content='images_image', content_rowid='id',
+        tokenize='porter unicode61')""",
+    f"""CREATE TRIGGER IF NOT EXISTS images_image_fts_insert AFTER INSERT ON images_image BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS images_image_fts_delete AFTER DELETE ON images_image BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    # saves rewrite every column, only reindex when the text changed
+    f"""CREATE TRIGGER IF NOT EXISTS images_image_fts_update AFTER UPDATE ON images_image
+    WHEN old.title IS NOT new.title OR old.description IS NOT new.description BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_TEARDOWN = [
+    'DROP TRIGGER IF EXISTS images_image_fts_insert',
+    'DROP TRIGGER IF EXISTS images_image_fts_delete',
+    'DROP TRIGGER IF EXISTS images_image_fts_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+POSTGRES_SETUP = [
+    # a generated column is kept up to date by postgres on every write
+    """ALTER TABLE images_image ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED""",
+    f'CREATE INDEX IF NOT EXISTS {GIN_INDEX} ON images_image USING GIN (search_vector)',
+]
+
+POSTGRES_TEARDOWN = [
+    f'DROP INDEX IF EXISTS {GIN_INDEX}',
+    'ALTER TABLE images_image DROP COLUMN IF EXISTS search_vector',
+]
+
+SQLITE_SEARCH = f"""
+    SELECT id, score FROM (
+        SELECT i.id AS id,
+               -bm25({FTS_TABLE}, 10.0, 1.0) *
+               (1 + %s * i.total_likes / (i.total_likes + %s)) AS score
+        FROM {FTS_TABLE} JOIN images_image i ON i.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s
+    ) {{where}}
+    ORDER BY score DESC, id DESC LIMIT %s"""
+
+POSTGRES_SEARCH = """
+    SELECT id, score FROM (
+        SELECT id,
+               ts_rank_cd(search_vector, query)::float8 *
+               (1 + %s * total_likes::float8 / (total_likes + %s)) AS score
+        FROM images_image, to_tsquery('english', %s) query
+        WHERE search_vector @@ query
+    ) ranked {where}
+    ORDER BY score DESC, id DESC LIMIT %s"""
+
+
+def setup_index(conn=connection):
+    statements = {'sqlite': SQLITE_SETUP, 'postgresql': POSTGRES_SETUP}
+    with conn.cursor() as cursor:
+        for sql in statements.get(conn.vendor, []):
+            cursor.execute(sql)
+
+
+def teardown_index(conn=connection):
+    statements = {'sqlite': SQLITE_TEARDOWN, 'postgresql': POSTGRES_TEARDOWN}
+    with conn.cursor() as cursor:
+        for sql in statements.get(conn.vendor, []):
+            cursor.execute(sql)
+
+
+def ensure_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    post_migrate handler. SQLite drops the triggers whenever a migration
+    rebuilds the images_image table, recreate them and reindex.
+    """
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM sqlite_master "
+                       "WHERE type = 'trigger' AND name LIKE 'images_image_fts_%'")
+        if cursor.fetchone()[0] == 3:
+            return
+    setup_index(conn)
+
+
+def rebuild_index():
+    # setup also reindexes every row on sqlite
+    setup_index()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'REINDEX INDEX {GIN_INDEX}')
+
+
+def encode_cursor(score, id):
+    return base64.urlsafe_b64encode(json.dumps([score, id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        score, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(score), int(id)
+    except (ValueError, TypeError):
+        return None
+
+
+def search_images(query, cursor=None, limit=20):
+    """
+    Return a page of images matching the query, ranked by text relevance
+    boosted by likes, and the cursor of the next page or None.
+    """
+    terms = re.findall(r'\w+', query.lower())[:10]
+    if not terms:
+        return [], None
+    after = decode_cursor(cursor) if cursor else None
+    where = 'WHERE score < %s OR (score = %s AND id < %s)' if after else ''
+    if connection.vendor == 'sqlite':
+        sql = SQLITE_SEARCH
+        match = ' '.join(f'"{term}"*' for term in terms)
+    elif connection.vendor == 'postgresql':
+        sql = POSTGRES_SEARCH
+        match = ' & '.join(f'{term}:*' for term in terms)
+    else:
+        return fallback_search(terms, after, limit)
+    params = [LIKES_BOOST, LIKES_HALF, match]
+    if after:
+        params += [after[0], after[0], after[1]]
+    with connection.cursor() as c:
+        # fetch one extra row to know whether there is a next page
+        c.execute(sql.format(where=where), params + [limit + 1])
+        rows = c.fetchall()
+    images = Image.objects.in_bulk([id for id, score in rows[:limit]])
+    results = [images[id] for id, score in rows[:limit] if id in images]
+    next_cursor = None
+    if len(rows) > limit:
+        last_id, last_score = rows[limit - 1]
+        next_cursor = encode_cursor(last_score, last_id)
+    return results, next_cursor
+
+
+def fallback_search(terms, after, limit):
+    # databases without a full-text index, order by likes
+    images = Image.objects.all()
+    for term in terms:
+        images = images.filter(title__icontains=term) | images.filter(description__icontains=term)
+    if after:
+        likes, id = after
+        images = images.filter(total_likes__lt=likes) | images.filter(total_likes=likes, id__lt=id)
+    rows = list(images.order_by('-total_likes', '-id')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.total_likes, last.id)
+    return rows[:limit], next_cursor
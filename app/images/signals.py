@@ -1,9 +1,24 @@
-from django.db.models.signals import m2m_changed
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save
 from django.dispatch import receiver
+from .dedup import add_originals
 from .models import Image
+from .tasks import generate_variants_task
 
 
 @receiver(m2m_changed, sender=Image.users_like.through)
 def users_like_changed(sender, instance, **kwargs):
     instance.total_likes = instance.users_like.count()
-    instance.save()
\ No newline at end of file
+    instance.save()
+
+
+@receiver(post_save, sender=Image)
+def image_created(sender, instance, created, **kwargs):
+    if not created:
+        return
+    add_originals([instance])
+    # ingest: the worker builds the responsive variants of new uploads,
+    # pages use the original until they are ready
+    if instance.image and not instance.variants:
+        image_id = instance.id
+        transaction.on_commit(lambda: generate_variants_task.delay(image_id))
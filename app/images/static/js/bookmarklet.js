@@ -1,30 +1,29 @@
-const siteUrl = '//pixmark.kiprutonick.work/';
-const styleUrl = siteUrl + 'static/css/bookmarklet.css';
+// siteUrl and bookmarkletCss are defined by the bundle served from
+// images/bookmarklet/<hash>.js, see images/bookmarklet.py
 const minWidth = 250;
 const minHeight = 250;
 
 // Load CSS
 var head = document.getElementsByTagName('head')[0];
-var link = document.createElement('link');
-link.rel = 'stylesheet';
-link.type = 'text/css';
-link.href = styleUrl + '?r=' + Math.floor(Math.random()*99999999999999999999);
-head.appendChild(link);
+var style = document.createElement('style');
+style.textContent = bookmarkletCss;
+head.appendChild(style);
 
 
 // Load HTML
 var body = document.getElementsByTagName('body')[0];
-boxHtml = '\
+var boxHtml = '\
     <div id="bookmarklet">\
         <a href="#" id="close">&times;</a>\
-        <h1>Select an image to bookmark:</h1>\
+        <h1>Select the images to bookmark:</h1>\
         <div class="images"></div>\
+        <a href="#" id="bookmark-selected">Bookmark selected</a>\
     </div>';
-body.innerHTML += boxHtml
+body.insertAdjacentHTML('beforeend', boxHtml);
 
 
 function bookmarkletLaunch(){
-    bookmarklet = document.getElementById('bookmarklet');
+    var bookmarklet = document.getElementById('bookmarklet');
     var imagesFound = bookmarklet.querySelector('.images');
 
     // clear images found
@@ -37,9 +36,9 @@ function bookmarkletLaunch(){
         .addEventListener('click', function(){
             bookmarklet.style.display = 'none';
         });
-    
+
     // find images in the DOM with the minimum dimensions
-    images = document.querySelectorAll('img[src$=".jpg"], img[src$=".jpeg"], img[src$=".png"]');
+    var images = document.querySelectorAll('img[src$=".jpg"], img[src$=".jpeg"], img[src$=".png"]');
     images.forEach(image => {
         if(image.naturalWidth >= minWidth && image.naturalHeight >= minHeight)
         {
@@ -52,12 +51,31 @@ function bookmarkletLaunch(){
     // select image event
     imagesFound.querySelectorAll('img').forEach(image => {
         image.addEventListener('click', function(event){
-            imageSelected = event.target;
-            bookmarklet.style.display = 'none';
-            window.open(siteUrl + 'images/create/?url=' + encodeURIComponent(imageSelected.src) + '&title=' + encodeURIComponent(document.title), '_blank');
+            event.target.classList.toggle('selected');
         })
     })
+
+    // bookmark the selection, a single image goes through the form so its
+    // title can be edited, several are sent in one request by the batch page
+    bookmarklet.querySelector('#bookmark-selected').onclick = function(event){
+        event.preventDefault();
+        var selected = Array.from(imagesFound.querySelectorAll('img.selected'));
+        if(!selected.length) {
+            return;
+        }
+        bookmarklet.style.display = 'none';
+        if(selected.length === 1) {
+            window.open(siteUrl + 'images/create/?url=' + encodeURIComponent(selected[0].src) + '&title=' + encodeURIComponent(document.title), '_blank');
+        }
+        else {
+            var images = selected.map(image => ({url: image.src, title: document.title}));
+            window.open(siteUrl + 'images/create/batch/#' + encodeURIComponent(JSON.stringify({images: images})), '_blank');
+        }
+    };
 }
 
+// the launcher calls it again on later clicks
+window.bookmarkletLaunch = bookmarkletLaunch;
+
 // Launch the bookmarklet
 bookmarkletLaunch();
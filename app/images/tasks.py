@@ -0,0 +1,47 @@
+import logging
+
+from celery import shared_task
+from django.contrib.auth.models import User
+from .importer import import_bookmarks
+from .models import Image
+from .variants import generate_variants
+from .recommendations import compute_also_liked
+from .counters import snapshot_views
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True)
+def import_bookmarks_task(self, user_id, entries):
+    user = User.objects.get(id=user_id)
+
+    def progress(done, total):
+        self.update_state(state='PROGRESS',
+                          meta={'user_id': user_id, 'done': done, 'total': total})
+
+    result = import_bookmarks(user, entries, progress=progress)
+    result['user_id'] = user_id
+    return result
+
+
+@shared_task
+def compute_also_liked_task():
+    return compute_also_liked()
+
+
+@shared_task
+def snapshot_views_task():
+    return snapshot_views()
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def generate_variants_task(self, image_id):
+    image = Image.objects.filter(id=image_id).first()
+    if not image or not image.image or image.variants:
+        return
+    try:
+        generate_variants(image)
+    except OSError as e:
+        # e.g. storage hiccups, generate_image_variants picks up the rest
+        logger.warning('Could not generate variants for image %s: %s', image_id, e)
+        raise self.retry(exc=e)
@@ -0,0 +1,37 @@
+from django import template
+from django.urls import reverse
+from ..bookmarklet import get_bundle
+from ..variants import FORMATS
+
+register = template.Library()
+
+
+def build_srcset(storage, entries):
+    return ', '.join(f'{storage.url(name)} {width}w' for width, name in entries)
+
+
+@register.inclusion_tag('images/image/picture.html')
+def picture(image, sizes='100vw', css_class='', alt='', loading='lazy'):
+    """
+    Render a <picture> with one srcset per variant format, so browsers
+    download the smallest file that fits the layout.
+    """
+    storage = image.image.storage
+    # FORMATS is ordered by preference, the JSON field order isn't reliable
+    sources = [{'type': FORMATS[fmt][1], 'srcset': build_srcset(storage, image.variants[fmt])}
+               for fmt in FORMATS if fmt != 'jpeg' and image.variants.get(fmt)]
+    jpeg = image.variants.get('jpeg')
+    return {'sources': sources,
+            'src': storage.url(jpeg[0][1]) if jpeg else image.image.url,
+            'srcset': build_srcset(storage, jpeg) if jpeg else '',
+            'sizes': sizes, 'css_class': css_class, 'alt': alt or image.title,
+            'loading': loading}
+
+
+@register.simple_tag(takes_context=True)
+def bookmarklet_url(context):
+    """
+    Protocol relative URL of the current bookmarklet bundle.
+    """
+    path = reverse('images:bookmarklet', args=[get_bundle()['version']])
+    return f'//{context["request"].get_host()}{path}'
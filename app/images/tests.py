@@ -1,3 +1,555 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+import brotli
+import requests
+from PIL import Image as PILImage
+from asgiref.sync import async_to_sync
+from celery.exceptions import Retry
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django import forms
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from . import dedup
+from core import redis_client
+from core.tests import RedisServerMixin
+from .counters import RANKING_KEY, restore_views, snapshot_views, views_key
+from .dedup import MultiIndexHash, hamming
+from .bookmarklet import get_bundle
+from .forms import BookmarkImportForm, ImageCreateForm
+from .importer import Downloader, import_bookmarks, interleave_hosts, parse_bookmarks
+from .models import Image
+from .search import decode_cursor, encode_cursor, search_images
+from .tasks import generate_variants_task
+from .variants import generate_variants
+
+
+class MediaMixin:
+    def use_temporary_media(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+        # no worker in tests, the variants are left out
+        delay = mock.patch.object(generate_variants_task, 'delay')
+        self.generate_variants = delay.start()
+        self.addCleanup(delay.stop)
+
+    def add_image(self, user, name, color='red', size=(40, 30), mode='RGB', **kwargs):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        PILImage.new(mode, size, color).save(path)
+        kwargs.setdefault('title', 'Picture')
+        kwargs.setdefault('url', 'https://example.com/a.jpg')
+        return Image.objects.create(user=user, image=name, **kwargs)
+
+
+async def asgi_get(application, path, headers=()):
+    # the response start message and the body of a GET request
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'root_path': '', 'headers': [(b'host', b'testserver'), *headers],
+        'client': ('127.0.0.1', 10000), 'server': ('testserver', 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    body = b''.join(m.get('body', b'') for m in messages if m['type'] == 'http.response.body')
+    return messages[0], body
+
+
+class ExportTests(MediaMixin, TransactionTestCase):
+    def setUp(self):
+        self.use_temporary_media()
+        self.user = User.objects.create_user('ann')
+        self.images = [self.add_image(self.user, f'images/ab/cd/{i}.jpg', title=f'Picture {i}')
+                       for i in range(3)]
+        other = User.objects.create_user('bob')
+        self.add_image(other, 'images/ab/cd/other.jpg')
+
+    def check_archive(self, data):
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        self.assertIsNone(archive.testzip())
+        manifest = json.loads(archive.read('manifest.json'))
+        self.assertEqual([entry['id'] for entry in manifest], [image.id for image in self.images])
+        for entry in manifest:
+            self.assertEqual(archive.read(entry['file']), open(
+                os.path.join(self.media, Image.objects.get(id=entry['id']).image.name), 'rb').read())
+
+    def test_wsgi(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/images/export/')
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.check_archive(b''.join(response.streaming_content))
+
+    def test_asgi(self):
+        from bookmarks.asgi import application
+        self.client.force_login(self.user)
+        cookie = f'sessionid={self.client.cookies["sessionid"].value}'.encode()
+        start, body = async_to_sync(asgi_get)(application, '/images/export/', [(b'cookie', cookie)])
+        self.assertEqual(start['status'], 200)
+        self.check_archive(body)
+
+    def test_missing_file(self):
+        os.remove(os.path.join(self.media, self.images[0].image.name))
+        self.client.force_login(self.user)
+        data = b''.join(self.client.get('/images/export/').streaming_content)
+        manifest = json.loads(zipfile.ZipFile(io.BytesIO(data)).read('manifest.json'))
+        self.assertIsNone(manifest[0]['file'])
+        self.assertEqual(len(manifest), 3)
+
+
+class VariantTests(MediaMixin, TestCase):
+    def setUp(self):
+        self.use_temporary_media()
+        self.user = User.objects.create_user('ann')
+
+    def test_new_images_are_queued(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = self.add_image(self.user, 'images/ab/cd/a.jpg')
+        self.generate_variants.assert_called_once_with(image.id)
+
+    def test_task(self):
+        image = self.add_image(self.user, 'images/ab/cd/a.jpg', size=(1000, 600))
+        generate_variants_task(image.id)
+        image.refresh_from_db()
+        self.assertEqual([width for width, name in image.variants['webp']], [320, 640, 960, 1000])
+        for fmt in ('webp', 'jpeg'):
+            for width, name in image.variants[fmt]:
+                with image.image.storage.open(name) as f:
+                    self.assertEqual(PILImage.open(f).width, width)
+
+    def test_transparency(self):
+        image = self.add_image(self.user, 'images/ab/cd/a.png', color=(255, 0, 0, 0), size=(400, 300),
+                               mode='RGBA')
+        # an opaque red square in the middle of a transparent picture
+        with PILImage.open(os.path.join(self.media, image.image.name)) as picture:
+            picture.load()
+        picture.paste((255, 0, 0, 255), (100, 100, 300, 200))
+        picture.save(os.path.join(self.media, image.image.name))
+        variants = generate_variants(image)
+        storage = image.image.storage
+        with storage.open(variants['webp'][0][1]) as f:
+            webp = PILImage.open(f).convert('RGBA')
+        self.assertEqual(webp.getpixel((0, 0))[3], 0)
+        self.assertEqual(webp.getpixel((160, 120))[3], 255)
+        with storage.open(variants['jpeg'][0][1]) as f:
+            jpeg = PILImage.open(f).convert('RGB')
+        # flattened onto white
+        self.assertGreater(min(jpeg.getpixel((0, 0))), 245)
+        self.assertGreater(jpeg.getpixel((160, 120))[0], 200)
+        self.assertLess(jpeg.getpixel((160, 120))[1], 60)
+
+    def test_task_is_retried(self):
+        image = self.add_image(self.user, 'images/ab/cd/a.jpg')
+        os.remove(os.path.join(self.media, image.image.name))
+        with mock.patch.object(generate_variants_task, 'retry', return_value=Retry()) as retry, \
+                self.assertLogs('images.tasks', 'WARNING'):
+            with self.assertRaises(Retry):
+                generate_variants_task(image.id)
+        self.assertIsInstance(retry.call_args.kwargs['exc'], OSError)
+
+
+def noise_png(seed, size=(90, 80)):
+    # a detailed picture, its resized copies hash (almost) the same
+    rng = random.Random(seed)
+    small = PILImage.frombytes('L', (9, 8), bytes(rng.randrange(256) for i in range(72)))
+    buffer = io.BytesIO()
+    small.resize(size, PILImage.BICUBIC).convert('RGB').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def flat_png(color):
+    buffer = io.BytesIO()
+    PILImage.new('RGB', (90, 80), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class MultiIndexHashTests(TestCase):
+    def test_query_finds_what_a_scan_finds(self):
+        rng = random.Random(0)
+        index = MultiIndexHash()
+        stored = {}
+        for id in range(1, 2001):
+            value = rng.getrandbits(64) - (1 << 63)
+            index.add(id, value)
+            stored[id] = value
+        for id in rng.sample(sorted(stored), 50):
+            # flip a few bits of a stored hash
+            query = stored[id]
+            for bit in rng.sample(range(64), rng.randrange(8)):
+                query ^= 1 << bit
+            for max_distance in (0, 3, 5, 6):
+                expected = sorted((hamming(query, value), other) for other, value in stored.items()
+                                  if hamming(query, value) <= max_distance)
+                self.assertEqual(index.query(query, max_distance), expected)
+
+    def test_contains(self):
+        index = MultiIndexHash()
+        index.add(7, 12345)
+        self.assertTrue(index.contains(7, 12345))
+        self.assertFalse(index.contains(8, 12345))
+
+
+class DuplicateTests(MediaMixin, TestCase):
+    def setUp(self):
+        self.use_temporary_media()
+        index = mock.patch.object(dedup, 'hash_index', dedup.ImageHashIndex())
+        index.start()
+        self.addCleanup(index.stop)
+        dedup.hash_index.load()
+        self.ann = User.objects.create_user('ann')
+        self.bob = User.objects.create_user('bob')
+
+    def bookmark(self, user, content, url='https://example.com/picture.png'):
+        form = ImageCreateForm(data={'title': 'Picture', 'url': url})
+        self.assertTrue(form.is_valid(), form.errors)
+        with mock.patch('images.forms.requests.get', return_value=mock.Mock(content=content)):
+            image = form.save(commit=False)
+        image.user = user
+        image.save()
+        return image
+
+    def read(self, image):
+        with image.image.open('rb') as f:
+            return f.read()
+
+    def test_identical_file_is_shared(self):
+        original = self.bookmark(self.ann, noise_png(1))
+        copy = self.bookmark(self.bob, noise_png(1))
+        self.assertEqual(copy.duplicate_of, original)
+        self.assertEqual(copy.image.name, original.image.name)
+
+    def test_near_duplicate_keeps_its_own_file(self):
+        original = self.bookmark(self.ann, noise_png(1))
+        resized = noise_png(1, size=(180, 160))
+        copy = self.bookmark(self.bob, resized)
+        self.assertEqual(copy.duplicate_of, original)
+        self.assertNotEqual(copy.image.name, original.image.name)
+        self.assertEqual(self.read(copy), resized)
+
+    def test_flat_pictures_are_not_duplicates(self):
+        red = self.bookmark(self.ann, flat_png('red'))
+        navy = self.bookmark(self.bob, flat_png('navy'))
+        self.assertEqual(red.phash, navy.phash)
+        self.assertIsNone(navy.duplicate_of)
+        self.assertEqual(self.read(navy), flat_png('navy'))
+
+    def test_different_pictures(self):
+        self.bookmark(self.ann, noise_png(1))
+        other = self.bookmark(self.bob, noise_png(2))
+        self.assertIsNone(other.duplicate_of)
+
+    @override_settings(RATE_LIMIT_ENABLED=False)
+    def test_user_is_sent_to_their_copy(self):
+        original = self.bookmark(self.ann, noise_png(1))
+        self.client.force_login(self.ann)
+        with mock.patch('images.forms.requests.get',
+                        return_value=mock.Mock(content=noise_png(1, size=(180, 160)))):
+            response = self.client.post('/images/create/', {
+                'title': 'Again', 'url': 'https://example.com/again.png'})
+        self.assertRedirects(response, original.get_absolute_url(), fetch_redirect_response=False)
+        self.assertEqual(Image.objects.filter(user=self.ann).count(), 1)
+
+    def test_index_loads_images_committed_out_of_order(self):
+        # the index of another process
+        index = dedup.ImageHashIndex()
+        index.load()
+        first = self.add_image(self.ann, 'images/ab/cd/first.png')
+        later = self.add_image(self.ann, 'images/ab/cd/later.png', id=first.id + 10,
+                               phash=dedup.dhash(io.BytesIO(noise_png(1))))
+        index.refresh()
+        self.assertEqual(index.query(later.phash, 0), [(0, later.id)])
+        # a transaction that got a lower id commits after the refresh
+        earlier = self.add_image(self.bob, 'images/ab/cd/earlier.png', id=first.id + 5,
+                                 phash=dedup.dhash(io.BytesIO(noise_png(2))))
+        index.refresh()
+        self.assertEqual(index.query(earlier.phash, 0), [(0, earlier.id)])
+
+    def test_lookups_stay_in_memory(self):
+        image = self.add_image(self.ann, 'images/ab/cd/a.png', phash=dedup.dhash(io.BytesIO(noise_png(1))))
+        # added by this process without waiting for a refresh
+        with self.assertNumQueries(0):
+            self.assertEqual(dedup.hash_index.query(image.phash, 5), [(0, image.id)])
+
+    def test_lookups_before_the_index_is_loaded(self):
+        image = self.add_image(self.ann, 'images/ab/cd/a.png', phash=dedup.dhash(io.BytesIO(noise_png(1))))
+        index = dedup.ImageHashIndex()
+        with mock.patch.object(index, 'warm') as warm:
+            self.assertEqual(index.query(image.phash, 6), [(0, image.id)])
+        warm.assert_called_once_with()
+
+
+class ParseBookmarksTests(SimpleTestCase):
+    expected = [
+        {'url': 'https://example.com/a.jpg', 'title': 'First', 'description': 'A picture'},
+        {'url': 'https://example.org/b.png', 'title': 'Second', 'description': ''},
+    ]
+
+    def test_html(self):
+        data = b"""<!DOCTYPE NETSCAPE-Bookmark-file-1>
+<DL><p>
+    <DT><H3>Pictures</H3>
+    <DL><p>
+        <DT><A HREF="https://example.com/a.jpg" ADD_DATE="1700000000">First</A>
+        <DD>A picture
+        <DT><A HREF="https://example.org/b.png">Second</A>
+    </DL><p>
+</DL><p>
+"""
+        self.assertEqual(parse_bookmarks(data, 'bookmarks.html'), self.expected)
+
+    def test_csv(self):
+        data = (b'\xef\xbb\xbfURL,Title,Description\r\n'
+                b'https://example.com/a.jpg,First,A picture\r\n'
+                b'https://example.org/b.png,Second,\r\n')
+        self.assertEqual(parse_bookmarks(data, 'bookmarks.csv'), self.expected)
+
+    def test_csv_without_url_column(self):
+        with self.assertRaises(forms.ValidationError):
+            parse_bookmarks(b'link,title\r\nhttps://example.com/a.jpg,First\r\n', 'bookmarks.csv')
+
+    def test_json(self):
+        rows = [{'url': 'https://example.com/a.jpg', 'title': 'First', 'description': 'A picture'},
+                {'url': 'https://example.org/b.png', 'title': 'Second'}, 'not a bookmark']
+        self.assertEqual(parse_bookmarks(json.dumps(rows).encode(), 'bookmarks.json'), self.expected)
+        self.assertEqual(parse_bookmarks(json.dumps({'bookmarks': rows})), self.expected)
+
+    def test_invalid_json(self):
+        with self.assertRaises(forms.ValidationError):
+            parse_bookmarks(b'[{"url": ', 'bookmarks.json')
+        with self.assertRaises(forms.ValidationError):
+            parse_bookmarks(b'"https://example.com/a.jpg"', 'bookmarks.json')
+
+    def test_interleave_hosts(self):
+        entries = [{'url': f'https://{host}/{i}.jpg'}
+                   for host, count in (('a.com', 3), ('b.com', 1), ('c.com', 2)) for i in range(count)]
+        self.assertEqual([entry['url'] for entry in interleave_hosts(entries)], [
+            'https://a.com/0.jpg', 'https://b.com/0.jpg', 'https://c.com/0.jpg',
+            'https://a.com/1.jpg', 'https://c.com/1.jpg', 'https://a.com/2.jpg'])
+
+    @override_settings(IMPORT_MAX_FILE_SIZE=100)
+    def test_upload_size(self):
+        data = b'url\r\n' + b'https://example.com/a.jpg\r\n' * 10
+        form = BookmarkImportForm(files={'file': SimpleUploadedFile('bookmarks.csv', data)})
+        self.assertFalse(form.is_valid())
+        self.assertIn('too large', form.errors['file'][0])
+        form = BookmarkImportForm(files={'file': SimpleUploadedFile('bookmarks.csv', data[:90])})
+        self.assertTrue(form.is_valid(), form.errors)
+
+
+class FakeResponse:
+    def __init__(self, status=200, content=b'', location=None):
+        self.status_code = status
+        self.content = content
+        self.headers = {'Location': location} if location else {}
+        self.is_redirect = location is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+    def iter_content(self, size):
+        return [self.content]
+
+
+class DownloaderTests(SimpleTestCase):
+    def fetch(self, url, responses):
+        downloader = Downloader()
+        session = mock.Mock()
+        session.get.side_effect = lambda url, **kwargs: responses[url]
+        downloader.local.session = session
+        content, error = downloader.fetch_or_error(url)
+        for call in session.get.call_args_list:
+            self.assertIs(call.kwargs['allow_redirects'], False)
+        return content, error, [call.args[0] for call in session.get.call_args_list]
+
+    def test_redirects_are_validated(self):
+        content, error, urls = self.fetch('https://example.com/a.png', {
+            'https://example.com/a.png': FakeResponse(301, location='https://cdn.example.org/a.png'),
+            'https://cdn.example.org/a.png': FakeResponse(302, location='/b.png'),
+            'https://cdn.example.org/b.png': FakeResponse(content=noise_png(1)),
+        })
+        self.assertEqual((content, error), (noise_png(1), None))
+        self.assertEqual(urls, ['https://example.com/a.png', 'https://cdn.example.org/a.png',
+                                'https://cdn.example.org/b.png'])
+        content, error, urls = self.fetch('https://example.com/a.png', {
+            'https://example.com/a.png': FakeResponse(302, location='http://10.0.0.1:8080/admin'),
+        })
+        self.assertIsNone(content)
+        self.assertIn('invalid URL', error)
+        self.assertEqual(len(urls), 1)
+
+    def test_too_many_redirects(self):
+        content, error, urls = self.fetch('https://example.com/a.png', {
+            'https://example.com/a.png': FakeResponse(302, location='https://example.com/a.png'),
+        })
+        self.assertEqual(error, 'Too many redirects.')
+        self.assertEqual(len(urls), 4)
+
+
+class ImportTests(MediaMixin, TestCase):
+    def setUp(self):
+        self.use_temporary_media()
+        index = mock.patch.object(dedup, 'hash_index', dedup.ImageHashIndex())
+        index.start()
+        self.addCleanup(index.stop)
+        dedup.hash_index.load()
+        self.user = User.objects.create_user('ann')
+
+    def run_import(self, entries, files):
+        def fetch(downloader, url):
+            return files[url]
+
+        with mock.patch.object(Downloader, 'fetch', fetch):
+            return import_bookmarks(self.user, entries)
+
+    def test_import(self):
+        self.add_image(self.user, 'images/ab/cd/old.png', url='https://example.com/old.png')
+        files = {'https://example.com/a.png': noise_png(1),
+                 'https://example.org/b.png': noise_png(2),
+                 # the first picture again, resized
+                 'https://example.net/c.png': noise_png(1, size=(180, 160))}
+        entries = [{'url': url, 'title': '', 'description': ''}
+                   for url in [*files, 'https://example.com/old.png', 'https://example.com/page.html']]
+        result = self.run_import(entries, files)
+        self.assertEqual((result['created'], result['skipped'], result['failed_count']), (2, 2, 1))
+        self.assertEqual(result['failed'][0]['url'], 'https://example.com/page.html')
+        images = Image.objects.filter(id__in=result['image_ids'])
+        self.assertEqual(sorted(image.url for image in images),
+                         ['https://example.com/a.png', 'https://example.org/b.png'])
+        for image in images:
+            with image.image.open('rb') as f:
+                self.assertEqual(f.read(), files[image.url])
+
+
+class HashImagesTests(MediaMixin, TestCase):
+    def add_file(self, user, name, content):
+        image = self.add_image(user, name)
+        with open(os.path.join(self.media, name), 'wb') as f:
+            f.write(content)
+        return image
+
+    def test_hash_and_flag_duplicates(self):
+        self.use_temporary_media()
+        ann = User.objects.create_user('ann')
+        original = self.add_file(ann, 'images/ab/cd/original.png', noise_png(1))
+        other = self.add_file(ann, 'images/ab/cd/other.png', noise_png(2))
+        missing = self.add_image(ann, 'images/ab/cd/missing.png')
+        os.remove(os.path.join(self.media, missing.image.name))
+        resized = self.add_file(ann, 'images/ab/cd/resized.png', noise_png(1, size=(180, 160)))
+        copy = self.add_file(ann, 'images/ab/cd/copy.png', noise_png(1))
+        out, err = io.StringIO(), io.StringIO()
+        # pages smaller than the number of images
+        call_command('hash_images', flag_duplicates=True, batch_size=2, stdout=out, stderr=err)
+        self.assertIn('Hashed 4 images, 1 failed.', out.getvalue())
+        self.assertIn(f'Image {missing.id}', err.getvalue())
+        images = Image.objects.in_bulk()
+        self.assertIsNone(images[missing.id].phash)
+        self.assertEqual(images[copy.id].checksum, images[original.id].checksum)
+        self.assertEqual({id: image.duplicate_of_id for id, image in images.items()}, {
+            original.id: None, other.id: None, missing.id: None,
+            resized.id: original.id, copy.id: original.id})
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('ann')
+        rng = random.Random(0)
+        # ties on the score are ordered by id
+        images = [Image(user=user, url=f'https://example.com/{i}.jpg', title=f'Sunset over the sea {i}',
+                        slug=f'sunset-{i}', total_likes=rng.randrange(4)) for i in range(25)]
+        images.append(Image(user=user, url='https://example.com/other.jpg', title='Mountains'))
+        # skips the signals that process the (missing) files
+        Image.objects.bulk_create(images)
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(1.0 / 3, 42)), (1.0 / 3, 42))
+        self.assertIsNone(decode_cursor('not a cursor'))
+
+    def test_pages(self):
+        everything, cursor = search_images('sunsets sea', limit=100)
+        self.assertEqual(len(everything), 25)
+        self.assertIsNone(cursor)
+        pages = []
+        cursor = None
+        while True:
+            page, cursor = search_images('sunsets sea', cursor, limit=7)
+            pages.append(page)
+            if not cursor:
+                break
+        self.assertEqual([len(page) for page in pages], [7, 7, 7, 4])
+        self.assertEqual([image for page in pages for image in page], everything)
+
+
+class ViewCounterTests(RedisServerMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('ann')
+        Image.objects.bulk_create([Image(user=user, url=f'https://example.com/{i}.jpg', slug=f'image-{i}')
+                                   for i in range(5)])
+        self.images = list(Image.objects.order_by('id'))
+        self.redis = redis_client.get_redis()
+
+    def views(self):
+        return list(Image.objects.order_by('id').values_list('views', flat=True))
+
+    def test_snapshot(self):
+        Image.objects.filter(id=self.images[4].id).update(views=50)
+        for image, views in zip(self.images, [3, 0, 7, 1, 20]):
+            if views:
+                self.redis.set(views_key(image.id), views)
+        self.assertEqual(snapshot_views(batch_size=2), 3)
+        # the lower counter of the last image was lost by Redis
+        self.assertEqual(self.views(), [3, 0, 7, 1, 50])
+        self.assertEqual(snapshot_views(), 0)
+
+    def test_restore(self):
+        for image, views in zip(self.images, [3, 0, 7, 1, 20]):
+            Image.objects.filter(id=image.id).update(views=views)
+        self.redis.set(views_key(self.images[2].id), 9)
+        self.redis.zadd(RANKING_KEY, {self.images[2].id: 9})
+        self.assertEqual(restore_views(batch_size=2), 4)
+        counters = self.redis.mget([views_key(image.id) for image in self.images])
+        # counted since the snapshot, kept
+        self.assertEqual(counters, [b'3', None, b'9', b'1', b'20'])
+        self.assertEqual(self.redis.zrevrange(RANKING_KEY, 0, -1, withscores=True), [
+            (str(self.images[i].id).encode(), views) for i, views in ((4, 20), (2, 9), (0, 3), (3, 1))])
+        # a second run adds nothing
+        restore_views()
+        self.assertEqual(self.redis.mget([views_key(image.id) for image in self.images]), counters)
+
+
+class BookmarkletTests(SimpleTestCase):
+    def test_encodings(self):
+        bundle = get_bundle()
+        url = f'/images/bookmarklet/{bundle["version"]}.js'
+        for accept, encoding, decompress in (('gzip, deflate, br', 'br', brotli.decompress),
+                                             ('gzip', 'gzip', gzip.decompress),
+                                             ('', None, bytes)):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING=accept)
+            self.assertEqual(response.get('Content-Encoding'), encoding)
+            self.assertEqual(decompress(response.content), bundle['identity'])
@@ -5,9 +5,16 @@ app_name = 'images'
 
 urlpatterns = [
     path('create/', views.image_create, name='create'),
+    path('create/batch/', views.image_create_batch, name='create_batch'),
+    path('api/bookmarks/', views.api_bookmarks, name='api_bookmarks'),
     path('detail/<int:id>/<slug:slug>/',
          views.image_detail, name='detail'),
     path('like/', views.image_like, name='like'),
+    path('import/', views.image_import, name='import'),
+    path('import/<task_id>/', views.image_import_status, name='import_status'),
+    path('export/', views.image_export, name='export'),
     path('', views.image_list, name='list'),
     path('ranking/', views.image_ranking, name='ranking'),
+    path('search/', views.image_search, name='search'),
+    path('bookmarklet/<str:version>.js', views.bookmarklet_bundle, name='bookmarklet'),
 ]
\ No newline at end of file
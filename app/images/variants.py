@@ -0,0 +1,70 @@
+import io
+import os
+
+from PIL import Image as PILImage, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+# format name: (Pillow format, mime type, extension, save options)
+FORMATS = {
+    'avif': ('AVIF', 'image/avif', 'avif', {'quality': 60}),
+    'webp': ('WEBP', 'image/webp', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg', {'quality': 82, 'progressive': True, 'optimize': True}),
+}
+
+
+def variant_formats():
+    # most efficient first, browsers pick the first <source> they support
+    formats = ['webp', 'jpeg']
+    PILImage.init()
+    if settings.IMAGE_VARIANT_AVIF and 'AVIF' in PILImage.SAVE:
+        formats.insert(0, 'avif')
+    return formats
+
+
+def variant_widths(source_width):
+    widths = [w for w in settings.IMAGE_VARIANT_WIDTHS if w < source_width]
+    # always keep one variant, at most as wide as the largest step
+    largest = min(source_width, max(settings.IMAGE_VARIANT_WIDTHS))
+    if largest not in widths:
+        widths.append(largest)
+    return widths
+
+
+def generate_variants(image):
+    """
+    Decode the image file once and store downscaled, metadata free copies
+    of it for every configured width and format. Returns the variants
+    mapping stored on the image.
+    """
+    storage = image.image.storage
+    with image.image.open('rb') as f:
+        source = PILImage.open(f)
+        # apply the EXIF orientation before the metadata is dropped
+        source = ImageOps.exif_transpose(source)
+        has_alpha = source.mode in ('RGBA', 'LA', 'PA') or 'transparency' in source.info
+        source = source.convert('RGBA' if has_alpha else 'RGB')
+    base = os.path.splitext(image.image.name)[0]
+    variants = {}
+    for width in variant_widths(source.width):
+        height = max(1, round(source.height * width / source.width))
+        resized = source.resize((width, height), PILImage.LANCZOS, reducing_gap=3.0)
+        for fmt in variant_formats():
+            pil_format, _, extension, options = FORMATS[fmt]
+            frame = resized
+            if fmt == 'jpeg' and has_alpha:
+                # JPEG has no alpha channel, WebP and AVIF keep it
+                frame = PILImage.new('RGB', resized.size, 'white')
+                frame.paste(resized, mask=resized.getchannel('A'))
+            buffer = io.BytesIO()
+            # only pixel data is written, EXIF and ICC data are left out
+            frame.save(buffer, pil_format, **options)
+            name = f'{base}_{width}w.{extension}'
+            if storage.exists(name):
+                storage.delete(name)
+            name = storage.save(name, ContentFile(buffer.getvalue()))
+            variants.setdefault(fmt, []).append([width, name])
+    image.variants = variants
+    type(image).objects.filter(id=image.id).update(variants=variants)
+    return variants
+
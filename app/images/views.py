@@ -1,23 +1,36 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .forms import ImageCreateForm
-from django.shortcuts import get_object_or_404
+from .forms import ImageCreateForm, BookmarkImportForm
+from .tasks import import_bookmarks_task
+from celery.result import AsyncResult
 from .models import Image
-from django.http import JsonResponse
+from .search import search_images
+from .dedup import user_copy
+from . import counters, recommendations
+from .bookmarklet import get_bundle
+from .export import export_zip
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.http import require_POST
+from .forms import validate_image_url
+from django import forms
+import json
 from django.http import HttpResponse
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.http import Http404
 from actions.utils import create_action
-import redis
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from core.decorators import async_login_required, async_require_POST
+from core.ratelimit import rate_limit
+from core import events
 
 
-# Connect to redis
-r = redis.Redis.from_url(settings.REDIS_URL)
-
 # Create your views here.
 @login_required
+@rate_limit('image_create')
 def image_create(request):
     if request.method == 'POST':
         # form is sent
@@ -26,6 +39,12 @@ def image_create(request):
             # form data is valid
             cd = form.cleaned_data
             new_image = form.save(commit=False)
+            if new_image.duplicate_of:
+                existing = user_copy(request.user, new_image.duplicate_of)
+                if existing:
+                    # merge into the bookmark the user already has
+                    messages.info(request, 'You already bookmarked this image.')
+                    return redirect(existing.get_absolute_url())
             # assign current user to the item
             new_image.user = request.user
             new_image.save()
@@ -39,32 +58,140 @@ def image_create(request):
     return render(request, 'images/image/create.html', {'section': 'images', 'form': form})
 
 
-def image_detail(request, id, slug):
-    image = get_object_or_404(Image, id=id, slug=slug)
-    # increment total image views by 1
-    total_views = r.incr(f'image:{image.id}:views')
-    # increment image ranking by 1
-    r.zincrby('image_ranking', 1, image.id)
-    return render(request,
-                  'images/image/detail.html',
-                  {'section': 'images',
-                   'image': image, 'total_views': total_views})
+@login_required
+def image_import(request):
+    if request.method == 'POST':
+        form = BookmarkImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            # downloads run in a celery worker, the page polls the progress
+            task = import_bookmarks_task.delay(request.user.id, form.entries)
+            return render(request, 'images/image/import.html',
+                          {'section': 'images', 'task_id': task.id,
+                           'total': len(form.entries)})
+    else:
+        form = BookmarkImportForm()
+    return render(request, 'images/image/import.html', {'section': 'images', 'form': form})
 
 
 @login_required
+def image_create_batch(request):
+    # the bookmarklet opens this page with the selected images in the URL
+    # fragment, the page sends them to api_bookmarks
+    return render(request, 'images/image/batch.html', {'section': 'images'})
+
+
 @require_POST
-def image_like(request):
+@rate_limit('api_bookmarks')
+def api_bookmarks(request):
+    """
+    Bookmark one or several images in one request. Accepts a JSON object
+    with url, title and description, or {"images": [...]} with several of
+    them. Valid images are downloaded by a worker, the response is sent
+    right away with the task to poll.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'status': 'error', 'error': 'Authentication required.'}, status=401)
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'error': 'Invalid JSON.'}, status=400)
+    items = data.get('images') if isinstance(data, dict) and 'images' in data else [data]
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'status': 'error', 'error': 'No images given.'}, status=400)
+    if len(items) > settings.API_MAX_BATCH:
+        return JsonResponse({'status': 'error',
+                             'error': f'At most {settings.API_MAX_BATCH} images per request.'},
+                            status=400)
+    entries, errors = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'error': 'Expected an object.'})
+            continue
+        entry = {'url': str(item.get('url') or '').strip(),
+                 'title': str(item.get('title') or '').strip()[:200],
+                 'description': str(item.get('description') or '').strip()}
+        try:
+            validate_image_url(entry['url'])
+        except forms.ValidationError as e:
+            errors.append({'index': index, 'url': entry['url'], 'error': ' '.join(e.messages)})
+            continue
+        entries.append(entry)
+    if not entries:
+        return JsonResponse({'status': 'error', 'errors': errors}, status=400)
+    task = import_bookmarks_task.delay(request.user.id, entries)
+    status_url = reverse('images:import_status', args=[task.id])
+    response = JsonResponse({'status': 'accepted', 'task_id': task.id, 'status_url': status_url,
+                             'accepted': len(entries), 'errors': errors}, status=202)
+    response['Location'] = status_url
+    return response
+
+
+@login_required
+def image_export(request):
+    # the archive is built while it is sent, its size isn't known up front
+    response = StreamingHttpResponse(export_zip(request.user), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{request.user.username}-bookmarks.zip"'
+    return response
+
+
+@login_required
+def image_import_status(request, task_id):
+    result = AsyncResult(task_id)
+    info = result.info if isinstance(result.info, dict) else {}
+    if info.get('user_id', request.user.id) != request.user.id:
+        return JsonResponse({'status': 'error'}, status=404)
+    if result.failed():
+        return JsonResponse({'status': 'error'})
+    return JsonResponse({'status': result.state.lower(), **info})
+
+
+async def image_detail(request, id, slug):
+    try:
+        image = await Image.objects.aget(id=id, slug=slug)
+    except Image.DoesNotExist:
+        raise Http404('No Image matches the given query.')
+    # count the view and read the precomputed "also liked" neighbours
+    total_views, also_liked_ids = await counters.record_view(image.id)
+    if total_views is None:
+        # Redis is unavailable, show the last snapshot
+        total_views = image.views
+    also_liked = [image async for image in Image.objects.filter(id__in=also_liked_ids)]
+    also_liked.sort(key=lambda x: also_liked_ids.index(x.id))
+    return await sync_to_async(render)(request,
+                                       'images/image/detail.html',
+                                       {'section': 'images',
+                                        'image': image, 'total_views': total_views,
+                                        'also_liked': also_liked})
+
+
+@sync_to_async
+def update_like(image, user, action):
+    liked = image.users_like.filter(id=user.id).exists()
+    if action == 'like':
+        image.users_like.add(user)
+        create_action(user, 'likes', image)
+        if not liked:
+            recommendations.record_like(user, image.id, 1)
+    elif liked:
+        image.users_like.remove(user)
+        recommendations.record_like(user, image.id, -1)
+
+
+@async_login_required
+@async_require_POST
+@rate_limit('image_like')
+async def image_like(request):
     image_id = request.POST.get('id')
     action = request.POST.get('action')
     if image_id and action:
         try:
-            image = Image.objects.get(id=image_id)
-            if action == 'like':
-                image.users_like.add(request.user)
-                create_action(request.user, 'likes', image)
-            else:
-                image.users_like.remove(request.user)
-            return JsonResponse({'status': 'ok'})
+            image = await Image.objects.aget(id=image_id)
+            await update_like(image, request.user, action)
+            # update the count on the pages of everyone viewing the image
+            if events.enabled():
+                await events.apublish(events.image_channel(image.id), 'likes',
+                                      {'id': image.id, 'likes': image.total_likes})
+            return JsonResponse({'status': 'ok', 'likes': image.total_likes})
         except Image.DoesNotExist:
             pass
     return JsonResponse({'status': 'error'})
@@ -92,14 +219,64 @@ def image_list(request):
     return render(request, 'images/image/list.html', {'section': 'images', 'images': images})
 
 
-@login_required
-def image_ranking(request):
-    # get image ranking dictionary
-    image_ranking = r.zrange('image_ranking', 0, -1, desc=True)[:10]
-    image_ranking_ids = [int(id) for id in image_ranking]
+@async_login_required
+async def image_ranking(request):
+    # get the 10 most viewed image ids
+    image_ranking_ids = await counters.top_ranked(10)
     # get most viewed images
-    most_viewed = list(Image.objects.filter(
+    most_viewed = [image async for image in Image.objects.filter(
         id__in=image_ranking_ids
-    ))
+    )]
     most_viewed.sort(key=lambda x: image_ranking_ids.index(x.id))
-    return render(request, 'images/image/ranking.html', {'section': 'images', 'most_viewed': most_viewed})
+    return await sync_to_async(render)(request, 'images/image/ranking.html', {'section': 'images', 'most_viewed': most_viewed})
+
+
+@login_required
+def image_search(request):
+    query = request.GET.get('q', '').strip()
+    images, next_cursor = search_images(query, request.GET.get('cursor'), limit=12)
+    if request.GET.get('images_only'):
+        response = render(request, 'images/image/list_images.html', {'section': 'images', 'images': images})
+        # the page asks for the next page with this cursor
+        response['X-Next-Cursor'] = next_cursor or ''
+        return response
+    return render(request, 'images/image/search.html',
+                  {'section': 'images', 'query': query, 'images': images, 'next_cursor': next_cursor})
+
+
+def accepted_encodings(request):
+    encodings = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = item.partition(';')
+        params = params.replace(' ', '')
+        try:
+            # "br;q=0" means not acceptable
+            if params.startswith('q=') and float(params[2:]) == 0:
+                continue
+        except ValueError:
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+def bookmarklet_bundle(request, version):
+    bundle = get_bundle()
+    if version != bundle['version']:
+        # launchers saved before a deploy still ask for an old version
+        response = redirect('images:bookmarklet', version=bundle['version'])
+        patch_cache_control(response, no_cache=True)
+        return response
+    etag = f'"{version}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+    else:
+        accepted = accepted_encodings(request)
+        encoding = next((e for e in ('br', 'gzip') if e in accepted), 'identity')
+        response = HttpResponse(bundle[encoding], content_type='application/javascript; charset=utf-8')
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    patch_vary_headers(response, ['Accept-Encoding'])
+    # the URL changes with the content, it can be cached for good
+    patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+    return response